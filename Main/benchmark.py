@@ -0,0 +1,197 @@
+"""
+File name: benchmark.py
+Benchmarks - Times the template generation hot paths and reports JSON
+
+Runs against the templates in Templates/ plus a synthetic large template
+(thousands of rows, hundreds of mappings) built in a temporary directory.
+Everything the benchmarks write, including the serial ledger, stays in that
+temporary directory.
+
+Example:
+    python benchmark.py --output bench.json
+    python benchmark.py --quick
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from label_index import LabelIndex, read_labels
+from template_editor import (ENGINES, PROFILES, get_base_path, invalidate_template, load_config,
+                             load_workbook, process_template_generation, save_modified_template)
+
+CATEGORY = 'Benchmark'
+QUANTITIES = (1, 10, 100, 1000)
+QUICK_QUANTITIES = (1, 10, 100)
+
+# Shape of the synthetic template
+LARGE_ROWS = 5000
+LARGE_COLUMNS = 12
+LARGE_MAPPINGS = 300
+
+# Batches of the synthetic template stop here; larger ones take many minutes
+LARGE_MAX_QUANTITY = 100
+
+def time_call(func: Callable, repeat: int) -> List[float]:
+    """Run func repeat times and return each duration in seconds."""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+def summarize(name: str, durations: List[float], **details) -> Dict:
+    """Build one result record."""
+    return {
+        'name': name,
+        **details,
+        'runs': len(durations),
+        'median_seconds': statistics.median(durations),
+        'min_seconds': min(durations),
+    }
+
+def build_large_template(path: str):
+    """Write a template with LARGE_ROWS rows of data and LARGE_MAPPINGS question cells."""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    sheet = wb.active
+    sheet.title = 'Items'
+    for row in range(1, LARGE_MAPPINGS + 1):
+        sheet.cell(row=row, column=1, value=f"Question {row}")
+    for row in range(LARGE_MAPPINGS + 1, LARGE_ROWS + 1):
+        for column in range(1, LARGE_COLUMNS + 1):
+            sheet.cell(row=row, column=column, value=f"R{row}C{column}")
+    wb.save(path)
+
+def build_config(work_dir: str) -> str:
+    """Write a benchmark config covering the shipped and synthetic templates."""
+    templates_dir = os.path.join(get_base_path(), 'Templates')
+    files = {}
+    for filename in sorted(os.listdir(templates_dir)):
+        path = os.path.join(templates_dir, filename)
+        try:
+            load_workbook(path, read_only=True).close()
+        except Exception:
+            # Skip placeholders that are not real workbooks
+            continue
+        files[filename] = {
+            'path': path,
+            'mappings': {f"B{row}": f"C{row}" for row in range(3, 9)},
+        }
+
+    large_path = os.path.join(work_dir, 'large_template.xlsx')
+    build_large_template(large_path)
+    files['large_template.xlsx'] = {
+        'path': large_path,
+        'mappings': {f"A{row}": f"B{row}" for row in range(1, LARGE_MAPPINGS + 1)},
+    }
+
+    config_path = os.path.join(work_dir, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump({'files': {CATEGORY: files}}, f, indent=2)
+    return config_path
+
+def sample_inputs(template_config: Dict, serial: str) -> Dict[str, str]:
+    """Fill every answer cell, with the serial number in the last one."""
+    answer_cells = list(template_config['mappings'].values())
+    inputs = {cell: f"Value {i}" for i, cell in enumerate(answer_cells)}
+    inputs[answer_cells[-1]] = serial
+    return inputs
+
+def run_benchmarks(quick: bool = False) -> Dict:
+    """Run every benchmark and return the results document."""
+    repeat = 3 if quick else 5
+    quantities = QUICK_QUANTITIES if quick else QUANTITIES
+    results = []
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        config_path = build_config(work_dir)
+        results.append(summarize('load_config', time_call(lambda: load_config(config_path), repeat * 4)))
+        config = load_config(config_path)
+
+        for template_name, template_config in config['files'][CATEGORY].items():
+            path = template_config['path']
+            mappings = template_config['mappings']
+
+            # What on_template_selected costs with and without the label index
+            results.append(summarize(
+                'labels_from_workbook', time_call(lambda: read_labels(path, mappings), repeat),
+                template=template_name))
+            index = LabelIndex(os.path.join(work_dir, 'labels.json'))
+            index.labels_for(path, mappings)
+            results.append(summarize(
+                'labels_from_index', time_call(lambda: index.labels_for(path, mappings), repeat * 4),
+                template=template_name))
+
+            output_path = os.path.join(work_dir, 'out', 'single.xlsx')
+            inputs = sample_inputs(template_config, 'BENCH')
+            for engine in ENGINES:
+                # Every parsed-template cache, so the cold run really starts from the file
+                invalidate_template()
+                cold = time_call(lambda: save_modified_template(path, inputs, output_path, engine), 1)
+                results.append(summarize('save_modified_template_cold', cold,
+                                         template=template_name, engine=engine))
+                warm = time_call(lambda: save_modified_template(path, inputs, output_path, engine), repeat)
+                results.append(summarize('save_modified_template', warm,
+                                         template=template_name, engine=engine))
+
+                # Time and output size of each writer profile
+                for profile in PROFILES:
+                    durations = time_call(
+                        lambda: save_modified_template(path, inputs, output_path, engine, profile), repeat)
+                    record = summarize('save_profile', durations,
+                                       template=template_name, engine=engine, profile=profile)
+                    record['output_bytes'] = os.path.getsize(output_path)
+                    results.append(record)
+
+                for quantity in quantities:
+                    if template_name == 'large_template.xlsx' and quantity > LARGE_MAX_QUANTITY:
+                        continue
+                    batch_dir = os.path.join(work_dir, 'batch')
+                    serial = f"{engine}-{quantity}"
+                    duration = time_call(lambda: process_template_generation(
+                        config, config_path, CATEGORY, template_name,
+                        sample_inputs(template_config, serial), quantity, batch_dir, engine
+                    ), 1)
+                    record = summarize('process_template_generation', duration,
+                                       template=template_name, engine=engine, quantity=quantity)
+                    record['files_per_second'] = quantity / duration[0]
+                    results.append(record)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'openpyxl': sys.modules['openpyxl'].__version__,
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark template generation")
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+    parser.add_argument('--quick', action='store_true', help="Fewer repeats and no 1000-file batches")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.quick)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+File name: catalogue.py
+Template Catalogue - Token and prefix search over categories and templates
+
+load_config builds one catalogue per config. Every category and template name
+is split into lower-case words; a query matches an entry when each of its words
+is the start of one of the entry's words, so "pack 33" finds
+"Packing List 33kV Single Manual". Lookups use a sorted word list and
+binary search, so they stay fast with thousands of templates.
+"""
+
+import re
+from bisect import bisect_left
+from typing import Dict, List, Set, Tuple
+
+_WORD_RE = re.compile(r'[0-9a-z]+')
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case words of a name or query."""
+    return _WORD_RE.findall(text.lower())
+
+class _PrefixIndex:
+    """Word -> entry ids, searchable by word prefix."""
+
+    def __init__(self):
+        self._postings: Dict[str, Set[int]] = {}
+        self._words: List[str] = []
+
+    def add(self, entry_id: int, text: str):
+        for word in tokenize(text):
+            self._postings.setdefault(word, set()).add(entry_id)
+
+    def freeze(self):
+        self._words = sorted(self._postings)
+
+    def search(self, query: str) -> Set[int]:
+        """Ids of the entries matching every word of the query, or None for an empty query."""
+        matches = None
+        for prefix in tokenize(query):
+            found = set()
+            position = bisect_left(self._words, prefix)
+            while position < len(self._words) and self._words[position].startswith(prefix):
+                found |= self._postings[self._words[position]]
+                position += 1
+            matches = found if matches is None else matches & found
+            if not matches:
+                return set()
+        return matches
+
+class TemplateCatalogue:
+    """Searchable list of the categories and templates of a config."""
+
+    def __init__(self, config: Dict):
+        self.categories: List[str] = list(config.get('files', {}))
+        self.templates: List[Tuple[str, str]] = [
+            (category, template)
+            for category, templates in config.get('files', {}).items()
+            for template in templates
+        ]
+        self._category_index = _PrefixIndex()
+        for entry_id, category in enumerate(self.categories):
+            self._category_index.add(entry_id, category)
+        self._category_index.freeze()
+
+        # Templates are found by their own name or their category's
+        self._template_index = _PrefixIndex()
+        self._by_category: Dict[str, List[int]] = {}
+        for entry_id, (category, template) in enumerate(self.templates):
+            self._template_index.add(entry_id, f"{category} {template}")
+            self._by_category.setdefault(category, []).append(entry_id)
+        self._template_index.freeze()
+
+    def search_categories(self, query: str = '', limit: int = None) -> List[str]:
+        """Category names matching the query, in config order."""
+        ids = self._category_index.search(query)
+        names = self.categories if ids is None else [self.categories[i] for i in sorted(ids)]
+        return names[:limit]
+
+    def search_templates(self, query: str = '', category: str = None, limit: int = None) -> List[Tuple[str, str]]:
+        """(category, template) pairs matching the query, in config order, optionally within one category."""
+        ids = self._template_index.search(query)
+        if category is not None:
+            in_category = self._by_category.get(category, [])
+            ids = in_category if ids is None else [i for i in in_category if i in ids]
+        elif ids is None:
+            ids = range(len(self.templates))
+        return [self.templates[i] for i in sorted(ids)][:limit]
@@ -0,0 +1,396 @@
+"""
+File name: cli.py
+Template Editor CLI - Headless bulk generation from CSV or JSONL files
+
+Example:
+    python cli.py generate --category "Packing Lists" \\
+        --template "Packing List 33kV Single Manual" orders.csv --output-dir Results
+
+Repeating --template fills several templates from each row in one pass.
+"""
+
+import argparse
+import os
+import sys
+from typing import Dict
+
+from config_watcher import DEFAULT_INTERVAL
+from job_journal import jobs_dir, unfinished_jobs
+from label_index import get_label_index
+from metrics import GenerationMetrics
+from service import DEFAULT_PORT, serve, submit_generation
+from document_index import get_document_index
+from template_editor import (ENGINES, OUTPUT_LAYOUTS, OUTPUT_MODES, PROFILES, get_base_path, iter_rows,
+                             load_config, process_fanout_generation, process_template_generation,
+                             render_manifest, reprint_documents, resume_job, verify_documents)
+from verifier import VerificationError
+
+# Optional column giving the number of documents for a row
+QUANTITY_FIELD = 'quantity'
+
+def build_field_map(mappings: Dict[str, str], labels: Dict[str, str]) -> Dict[str, str]:
+    """
+    Map accepted column names to answer cells.
+
+    A column may be named after the answer cell itself (e.g. C3) or after the
+    question text shown in the GUI (e.g. Customer), case-insensitively.
+    """
+    field_map = {}
+    for question_cell, answer_cell in mappings.items():
+        field_map[answer_cell.lower()] = answer_cell
+        label = labels.get(question_cell, '').strip().lower()
+        if label:
+            field_map.setdefault(label, answer_cell)
+    return field_map
+
+def row_to_inputs(row: Dict[str, str], field_map: Dict[str, str]) -> Dict[str, str]:
+    """Convert a data row into the user_inputs dict process_template_generation expects."""
+    inputs = {}
+    for field, value in row.items():
+        if field is None or field.strip().lower() == QUANTITY_FIELD:
+            continue
+        answer_cell = field_map.get(field.strip().lower())
+        if answer_cell is None:
+            raise ValueError(f"Unknown column '{field}'")
+        inputs[answer_cell] = "" if value is None else str(value)
+    return inputs
+
+def load_tables(table_args) -> Dict[str, list]:
+    """Read the rows of each --table NAME=FILE argument."""
+    tables = {}
+    for table_arg in table_args or []:
+        name, separator, path = table_arg.partition('=')
+        if not separator or not name or not path:
+            raise ValueError(f"--table expects NAME=FILE, got '{table_arg}'")
+        tables[name] = list(iter_rows(path))
+    return tables
+
+def generate(args) -> int:
+    """Generate documents for every row of the input file."""
+    config = load_config(args.config)
+    fanout = len(args.template) > 1
+    if fanout and args.output_mode != 'files':
+        print("Error: Several templates can only be generated with --output-mode files", file=sys.stderr)
+        return 1
+    if args.category not in config['files']:
+        args.parser.error(f"unknown category '{args.category}'")
+    for template_name in args.template:
+        if template_name not in config['files'][args.category]:
+            args.parser.error(f"unknown template '{template_name}' in category '{args.category}'")
+    field_map = {}
+    for template_name in args.template:
+        template_config = config['files'][args.category][template_name]
+        labels = get_label_index(args.config).labels_for(template_config['path'], template_config['mappings'])
+        for field, answer_cell in build_field_map(template_config['mappings'], labels).items():
+            field_map.setdefault(field, answer_cell)
+    metrics = GenerationMetrics(args.metrics_log)
+    try:
+        tables = load_tables(args.table)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    documents = 0
+    row_number = 0
+    unverified_rows = 0
+    for row_number, row in enumerate(iter_rows(args.rows), 1):
+        try:
+            quantity = int(row.get(QUANTITY_FIELD) or 1)
+            if args.server:
+                # Thin client: a running service does the work with its warm templates
+                response = submit_generation(args.server, {
+                    'category': args.category,
+                    'template': args.template[0],
+                    'templates': args.template if fanout else None,
+                    'inputs': row_to_inputs(row, field_map),
+                    'quantity': quantity,
+                    'output_dir': os.path.abspath(args.output_dir),
+                    'engine': args.engine,
+                    'workers': args.workers,
+                    'output_mode': args.output_mode,
+                    'compresslevel': args.compresslevel,
+                    'tables': tables or None,
+                    'profile': args.profile,
+                    'layout': args.layout,
+                    'verify': args.verify,
+                })
+                generated_files = response['files']
+            elif fanout:
+                generated_files = process_fanout_generation(
+                    config,
+                    args.config,
+                    args.category,
+                    args.template,
+                    row_to_inputs(row, field_map),
+                    quantity,
+                    args.output_dir,
+                    engine=args.engine,
+                    workers=args.workers,
+                    metrics=metrics,
+                    tables=tables or None,
+                    profile=args.profile,
+                    layout=args.layout,
+                    verify=args.verify
+                )
+            else:
+                generated_files = process_template_generation(
+                    config,
+                    args.config,
+                    args.category,
+                    args.template[0],
+                    row_to_inputs(row, field_map),
+                    quantity,
+                    args.output_dir,
+                    engine=args.engine,
+                    workers=args.workers,
+                    output_mode=args.output_mode,
+                    bundle_compresslevel=args.compresslevel,
+                    metrics=metrics,
+                    tables=tables or None,
+                    profile=args.profile,
+                    layout=args.layout,
+                    verify=args.verify
+                )
+        except VerificationError as e:
+            # The row's documents are written and their serial numbers used; carry on with the next row
+            print(f"Row {row_number}: {e.report.format()}", file=sys.stderr)
+            generated_files = e.files
+            unverified_rows += 1
+        except Exception as e:
+            print(f"Error on row {row_number}: {e}", file=sys.stderr)
+            print(f"Generated {documents} document(s) before the error.", file=sys.stderr)
+            return 1
+
+        # A 'workbook', 'zip' or 'manifest' bundle holds all of a row's copies in one file
+        documents += len(generated_files) if args.output_mode == 'files' else quantity
+        if row_number % 1000 == 0:
+            print(f"{row_number} rows, {documents} documents...", file=sys.stderr)
+
+    print(f"Generated {documents} document(s) in {args.output_dir}")
+    if not args.server:
+        # With --server the timings are taken by the service instead
+        metrics.finish(category=args.category, template=', '.join(args.template), rows=row_number, engine=args.engine)
+        print(metrics.format_summary())
+    if unverified_rows:
+        print(f"Verification failed for {unverified_rows} row(s); see above.", file=sys.stderr)
+        return 1
+    return 0
+
+def resume(args) -> int:
+    """List or finish the batches left behind by interrupted runs."""
+    jobs = unfinished_jobs(jobs_dir(args.config))
+    if not jobs:
+        print("No interrupted jobs.")
+        return 0
+    config = load_config(args.config) if not args.list else None
+    for job in jobs:
+        request = job.request
+        print(f"{request['template']} {job.base_serial}-{job.first_count} to {job.base_serial}-{job.last_count}: "
+              f"{len(job.reconcile())} of {request['quantity']} done")
+        if args.list:
+            continue
+        try:
+            generated_files = resume_job(config, args.config, job, workers=args.workers)
+        except Exception as e:
+            print(f"Error resuming job: {e}", file=sys.stderr)
+            return 1
+        print(f"  completed; {len(generated_files)} file(s) in {request['output_dir']}")
+    return 0
+
+def render(args) -> int:
+    """Render records of a manifest written with --output-mode manifest."""
+    config = load_config(args.config)
+    metrics = GenerationMetrics(args.metrics_log)
+    try:
+        generated_files = render_manifest(
+            config,
+            args.manifest,
+            serial_numbers=args.serial or None,
+            output_dir=args.output_dir,
+            engine=args.engine,
+            workers=args.workers,
+            allow_template_change=args.allow_template_change,
+            metrics=metrics,
+            profile=args.profile,
+            layout=args.layout,
+            config_path=args.config
+        )
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    metrics.finish(manifest=args.manifest, engine=args.engine)
+    print(f"Rendered {len(generated_files)} document(s)")
+    print(metrics.format_summary())
+    return 0
+
+def lookup(args) -> int:
+    """Show where the documents of a serial number, base serial number or template are."""
+    index = get_document_index(args.config)
+    if args.serial:
+        record = index.lookup(args.serial)
+        documents = [record] if record else []
+    else:
+        documents = index.find(base_serial=args.base, template=args.template, limit=args.limit)
+    if not documents:
+        print("No matching documents.", file=sys.stderr)
+        return 1
+    for document in documents:
+        print(f"{document['serial']}\t{document['template']}\t{document['created']}\t{document['path']}")
+    return 0
+
+def reprint(args) -> int:
+    """Render documents again from the values recorded in the document index."""
+    config = load_config(args.config)
+    metrics = GenerationMetrics(args.metrics_log)
+    try:
+        generated_files = reprint_documents(
+            config,
+            args.config,
+            args.serial,
+            output_dir=args.output_dir,
+            engine=args.engine,
+            workers=args.workers,
+            allow_template_change=args.allow_template_change,
+            metrics=metrics,
+            profile=args.profile
+        )
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    metrics.finish(engine=args.engine)
+    for path in generated_files:
+        print(path)
+    print(metrics.format_summary())
+    return 0
+
+def verify(args) -> int:
+    """Read generated documents back and check them against the document index."""
+    config = load_config(args.config)
+    metrics = GenerationMetrics(args.metrics_log)
+    try:
+        report = verify_documents(
+            config,
+            args.config,
+            serial_numbers=args.serial or None,
+            base_serial=args.base,
+            template=args.template,
+            workers=args.workers,
+            metrics=metrics
+        )
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    metrics.finish(checked=report.checked, failed=len(report.failures), gaps=len(report.gaps))
+    print(report.format(limit=args.limit))
+    print(metrics.format_summary())
+    return 0 if report.passed else 2
+
+def run_service(args) -> int:
+    """Run the long-lived generation service."""
+    serve(args.config, args.port, args.workers, args.engine, args.watch_interval)
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Template Editor command line")
+    parser.add_argument(
+        '--config',
+        default=os.path.join(get_base_path(), 'config.json'),
+        help="Path to config.json (default: the one next to the application)"
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = commands.add_parser('generate', help="Generate one document per row of a CSV/JSONL file")
+    generate_parser.add_argument('rows', help="CSV or JSONL file, one row per document")
+    generate_parser.add_argument('--category', required=True)
+    generate_parser.add_argument('--template', required=True, action='append',
+                                 help="May be repeated to fill several templates sharing answer cells from each row")
+    generate_parser.add_argument('--output-dir', required=True)
+    generate_parser.add_argument('--table', action='append', metavar='NAME=FILE',
+                                 help="Fill the template's table NAME with the rows of a CSV/JSONL file, "
+                                      "for every document; may be repeated")
+    generate_parser.add_argument('--engine', choices=ENGINES, default='xml')
+    generate_parser.add_argument('--workers', type=int, default=1,
+                                 help="Processes used for rows with a large quantity")
+    generate_parser.add_argument('--output-mode', choices=OUTPUT_MODES, default='files',
+                                 help="'workbook' or 'zip' put each row's serial numbers in one file; "
+                                      "'manifest' only records them (see 'render')")
+    generate_parser.add_argument('--profile', choices=PROFILES, default='default',
+                                 help="How each workbook is compressed: 'stored' or 'fast' for speed, "
+                                      "'archive' for the smallest files")
+    generate_parser.add_argument('--layout', choices=OUTPUT_LAYOUTS, default='flat',
+                                 help="Put the files in subdirectories by date ('date', YEAR/MONTH), "
+                                      "base serial number ('serial') or both ('date-serial')")
+    generate_parser.add_argument('--verify', action='store_true',
+                                 help="Read each row's documents back and stop with an error if any is wrong")
+    generate_parser.add_argument('--compresslevel', type=int, choices=range(10), default=6,
+                                 help="Deflate level for 'zip' bundles (0 stores uncompressed)")
+    generate_parser.add_argument('--metrics-log',
+                                 help="Append a JSON summary of per-stage timings to this file")
+    generate_parser.add_argument('--server', metavar='URL',
+                                 help="Send rows to a running service (see 'serve') instead of rendering here")
+    generate_parser.set_defaults(handler=generate, parser=generate_parser)
+
+    render_parser = commands.add_parser('render', help="Render records of a manifest to XLSX files")
+    render_parser.add_argument('manifest', help="manifest.jsonl written by --output-mode manifest")
+    render_parser.add_argument('--serial', action='append',
+                               help="Serial number to render, e.g. 100-6; repeat for more (default: all)")
+    render_parser.add_argument('--output-dir', help="Where to write the files (default: next to the manifest)")
+    render_parser.add_argument('--engine', choices=ENGINES, default='xml')
+    render_parser.add_argument('--profile', choices=PROFILES, default='default',
+                               help="How each workbook is compressed (see 'generate --profile')")
+    render_parser.add_argument('--layout', choices=OUTPUT_LAYOUTS, default='flat',
+                               help="Subdirectories to put the files in (see 'generate --layout')")
+    render_parser.add_argument('--workers', type=int, default=1)
+    render_parser.add_argument('--allow-template-change', action='store_true',
+                               help="Render even if the template changed since the serial numbers were issued")
+    render_parser.add_argument('--metrics-log', help="Append a JSON summary of per-stage timings to this file")
+    render_parser.set_defaults(handler=render)
+
+    lookup_parser = commands.add_parser('lookup', help="Find generated documents in the document index")
+    lookup_parser.add_argument('serial', nargs='?', help="Serial number of one document, e.g. 100-6")
+    lookup_parser.add_argument('--base', help="Every document of a base serial number, e.g. 100")
+    lookup_parser.add_argument('--template', help="Every document of a template")
+    lookup_parser.add_argument('--limit', type=int, help="Show at most this many documents")
+    lookup_parser.set_defaults(handler=lookup)
+
+    reprint_parser = commands.add_parser('reprint', help="Render documents again from the document index")
+    reprint_parser.add_argument('serial', nargs='+', help="Serial numbers of the documents, e.g. 100-6")
+    reprint_parser.add_argument('--output-dir', help="Where to write the files (default: where the originals are)")
+    reprint_parser.add_argument('--engine', choices=ENGINES, default='xml')
+    reprint_parser.add_argument('--profile', choices=PROFILES, default='default')
+    reprint_parser.add_argument('--workers', type=int, default=1)
+    reprint_parser.add_argument('--allow-template-change', action='store_true',
+                                help="Render even if the template changed since the documents were generated")
+    reprint_parser.add_argument('--metrics-log', help="Append a JSON summary of per-stage timings to this file")
+    reprint_parser.set_defaults(handler=reprint)
+
+    verify_parser = commands.add_parser('verify', help="Check generated documents hold the values they were given")
+    verify_parser.add_argument('serial', nargs='*', help="Serial numbers to check (default: see --base/--template)")
+    verify_parser.add_argument('--base', help="Check every document of a base serial number")
+    verify_parser.add_argument('--template', help="Check every document of a template")
+    verify_parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1), help="Processes reading documents")
+    verify_parser.add_argument('--limit', type=int, default=20, help="Most failures to list")
+    verify_parser.add_argument('--metrics-log', help="Append a JSON summary of per-stage timings to this file")
+    verify_parser.set_defaults(handler=verify)
+
+    resume_parser = commands.add_parser('resume', help="Finish batches left behind by interrupted runs")
+    resume_parser.add_argument('--list', action='store_true', help="Only show the interrupted batches")
+    resume_parser.add_argument('--workers', type=int, default=1)
+    resume_parser.set_defaults(handler=resume)
+
+    serve_parser = commands.add_parser('serve', help="Run a local generation service with warm templates")
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--workers', type=int, default=4, help="Requests run at the same time")
+    serve_parser.add_argument('--engine', choices=ENGINES, default='xml',
+                              help="Default writer engine for requests that do not name one")
+    serve_parser.add_argument('--watch-interval', type=float, default=DEFAULT_INTERVAL, metavar='SECONDS',
+                              help="How often to check config.json and the templates for edits (0 turns it off)")
+    serve_parser.set_defaults(handler=run_service)
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+File name: config_watcher.py
+Config Watcher - Picks up edits to config.json and the template files while running
+
+The GUI and the service poll the watcher every couple of seconds. Each check
+only stats config.json and the templates it names; nothing is re-read unless
+a file's mtime, size or inode changed. A changed config is loaded again (a
+config that does not load is reported and the current one kept), and a changed
+template is dropped from the parsed-template caches and the label index, so
+nothing else has to be restarted or rebuilt.
+"""
+
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from label_index import LabelIndex, get_label_index
+from template_editor import invalidate_template, load_config
+
+# Seconds between checks
+DEFAULT_INTERVAL = 2.0
+
+def file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    """(mtime, size, inode) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    # The inode catches a template replaced by a copy that kept its mtime and size
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+class FileWatcher:
+    """Remembers the stamp of each watched file and reports the ones that changed."""
+
+    def __init__(self, paths: Iterable[str] = ()):
+        self._stamps: Dict[str, Optional[Tuple[int, int, int]]] = {}
+        self.watch(paths)
+
+    def watch(self, paths: Iterable[str]):
+        """Watch exactly these paths from now on; paths not watched before are stamped as they are now."""
+        self._stamps = {
+            path: self._stamps[path] if path in self._stamps else file_stamp(path)
+            for path in paths
+        }
+
+    def changed(self) -> List[str]:
+        """Paths created, modified, replaced or deleted since the last call."""
+        changed = []
+        for path, stamp in self._stamps.items():
+            current = file_stamp(path)
+            if current != stamp:
+                self._stamps[path] = current
+                changed.append(path)
+        return changed
+
+class ConfigChanges(NamedTuple):
+    """What a check found; templates lists (category, template) entries that were added, edited, removed or whose file changed."""
+    config_reloaded: bool
+    templates: List[Tuple[str, str]]
+
+def _template_entries(config: Dict) -> Dict[Tuple[str, str], Tuple]:
+    """(category, template) -> what the entry says, for telling which entries a reload changed."""
+    if not config:
+        return {}
+    return {
+        (category_name, template_name): (
+            details.get('path'), details.get('mappings'), details.get('tables')
+        )
+        for category_name, category in config.get('files', {}).items()
+        for template_name, details in category.items()
+    }
+
+class ConfigWatcher:
+    """Keeps a loaded config in step with config.json and its templates."""
+
+    def __init__(self, config_path: str, config: Dict, label_index: LabelIndex = None):
+        self.config_path = config_path
+        self.config = config
+        self.label_index = label_index or get_label_index(config_path)
+        self._watcher = FileWatcher([config_path] + self._template_paths())
+
+    def _template_paths(self) -> List[str]:
+        return sorted({entry[0] for entry in _template_entries(self.config).values() if entry[0]})
+
+    def check(self) -> ConfigChanges:
+        """Reload whatever changed since the last check."""
+        changed_paths = self._watcher.changed()
+        if not changed_paths:
+            return ConfigChanges(False, [])
+
+        old_entries = _template_entries(self.config)
+        old_paths = set(self._template_paths())
+        config_reloaded = False
+        if self.config_path in changed_paths:
+            try:
+                self.config = load_config(self.config_path)
+                config_reloaded = True
+            except Exception as e:
+                # Most likely saved half way through an edit; the next save is picked up
+                print(f"Warning: Keeping the current configuration, could not reload {self.config_path}: {e}")
+
+        new_entries = _template_entries(self.config)
+        changed_files = set(changed_paths) - {self.config_path}
+        templates = [
+            key for key in sorted(set(old_entries) | set(new_entries))
+            if old_entries.get(key) != new_entries.get(key)
+            or (key in new_entries and new_entries[key][0] in changed_files)
+        ]
+
+        # Changed templates are parsed again on next use; removed ones just free their memory
+        for path in changed_files | (old_paths - set(self._template_paths())):
+            invalidate_template(path)
+            self.label_index.invalidate(path)
+        for category in (self.config or {}).get('files', {}).values():
+            for details in category.values():
+                if details.get('path') in changed_files:
+                    details['spec'].invalidate()
+        self._watcher.watch([self.config_path] + self._template_paths())
+        return ConfigChanges(config_reloaded, templates)
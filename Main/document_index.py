@@ -0,0 +1,158 @@
+"""
+File name: document_index.py
+Document Index - SQLite index of every generated document by serial number
+
+Each generated document gets a row in documents.sqlite next to config.json
+holding its serial number, template, path, when it was written and the values
+it was filled with. Finding or reprinting the document for a serial number is
+then one indexed query instead of a walk over the output directories.
+
+A serial number can be issued again once the ledger has evicted it (see
+serial_ledger.py), so rows are keyed by serial number, path and time written:
+the earlier document's row is kept, and lookup returns the newest.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+INDEX_FILENAME = 'documents.sqlite'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    serial TEXT NOT NULL,
+    base_serial TEXT NOT NULL,
+    category TEXT NOT NULL,
+    template TEXT NOT NULL,
+    template_sha256 TEXT,
+    path TEXT NOT NULL,
+    created TEXT NOT NULL,
+    filled_values TEXT NOT NULL,
+    tables TEXT,
+    PRIMARY KEY (serial, path, created)
+);
+CREATE INDEX IF NOT EXISTS documents_base_serial ON documents (base_serial, created);
+CREATE INDEX IF NOT EXISTS documents_template ON documents (template, created);
+'''
+
+_COLUMNS = ('serial', 'base_serial', 'category', 'template', 'template_sha256', 'path', 'created',
+            'filled_values', 'tables')
+
+class DocumentIndex:
+    """Serial number -> generated document, stored in SQLite."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connection() as connection:
+            # Readers (lookups, the GUI) then never wait for a batch being recorded
+            connection.execute('PRAGMA journal_mode=WAL')
+            _upgrade(connection)
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connection(self):
+        # A connection per call keeps the index safe to use from several threads and processes
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def record(self, entries: Iterable[Dict]) -> int:
+        """
+        Add documents in one transaction; returns how many were added.
+
+        Each entry has the keys of a manifest record (see manifest.py) plus
+        'base_serial', 'path' and 'created'. A serial number already in the
+        index with other values was issued again after the ledger evicted it;
+        both documents are kept, with a warning.
+        """
+        rows = [
+            (entry['serial'], entry['base_serial'], entry['category'], entry['template'],
+             entry.get('template_sha256'), os.path.abspath(entry['path']), entry['created'],
+             json.dumps(entry['values']), json.dumps(entry['tables']) if entry.get('tables') else None)
+            for entry in entries
+        ]
+        if rows:
+            with self._connection() as connection:
+                for serial, *_, filled_values, _ in rows:
+                    newest = connection.execute(
+                        "SELECT path, filled_values FROM documents WHERE serial = ? ORDER BY created DESC, rowid DESC LIMIT 1",
+                        (serial,)
+                    ).fetchone()
+                    if newest and newest[1] != filled_values:
+                        print(f"Warning: Serial number {serial} was already issued for {newest[0]}")
+                connection.executemany(
+                    f"INSERT OR REPLACE INTO documents ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                    rows
+                )
+        return len(rows)
+
+    def lookup(self, serial: str) -> Optional[Dict]:
+        """The newest document with a serial number, or None."""
+        with self._connection() as connection:
+            row = connection.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM documents WHERE serial = ? ORDER BY created DESC, rowid DESC LIMIT 1",
+                (serial,)
+            ).fetchone()
+        return _to_record(row) if row else None
+
+    def find(self, base_serial: str = None, template: str = None, limit: int = None) -> List[Dict]:
+        """Documents of a base serial number and/or template, oldest first."""
+        conditions = []
+        parameters = []
+        if base_serial is not None:
+            conditions.append('base_serial = ?')
+            parameters.append(base_serial)
+        if template is not None:
+            conditions.append('template = ?')
+            parameters.append(template)
+        query = f"SELECT {', '.join(_COLUMNS)} FROM documents"
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY created, rowid'
+        if limit is not None:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+        with self._connection() as connection:
+            return [_to_record(row) for row in connection.execute(query, parameters)]
+
+def _upgrade(connection: sqlite3.Connection):
+    """Re-key an index written when serial numbers were its primary key, keeping its rows."""
+    row = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'documents'").fetchone()
+    if not row or 'serial TEXT PRIMARY KEY' not in row[0]:
+        return
+    # One transaction, so an interrupted upgrade leaves the old table as it was
+    connection.execute('BEGIN')
+    connection.execute('DROP INDEX IF EXISTS documents_base_serial')
+    connection.execute('DROP INDEX IF EXISTS documents_template')
+    connection.execute('ALTER TABLE documents RENAME TO documents_old')
+    for statement in _SCHEMA.split(';'):
+        if statement.strip():
+            connection.execute(statement)
+    connection.execute(f"INSERT INTO documents ({', '.join(_COLUMNS)}) SELECT {', '.join(_COLUMNS)} FROM documents_old")
+    connection.execute('DROP TABLE documents_old')
+
+def _to_record(row) -> Dict:
+    """A row as a manifest-style record (see manifest.py), so it can be rendered again."""
+    record = dict(zip(_COLUMNS, row))
+    record['values'] = json.loads(record.pop('filled_values'))
+    tables = record.pop('tables')
+    if tables:
+        record['tables'] = json.loads(tables)
+    return record
+
+_indexes: Dict[str, DocumentIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_document_index(config_path: str) -> DocumentIndex:
+    """Return the document index stored next to a config file."""
+    path = os.path.join(os.path.dirname(os.path.abspath(config_path)), INDEX_FILENAME)
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = DocumentIndex(path)
+        return _indexes[path]
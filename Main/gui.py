@@ -3,9 +3,17 @@ file name: gui.py
 Template Editor GUI - A user-friendly interface for the Template Editor
 """
 
+import time
+
+# Taken before any other import so --startup-timing covers the whole start
+STARTED_AT = time.perf_counter()
+
+import multiprocessing
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-from tkinter.filedialog import asksaveasfilename
+from tkinter.filedialog import askopenfilename, asksaveasfilename
 import os
 from pathlib import Path
 from typing import Dict, Any
@@ -19,7 +27,21 @@ from pathlib import Path
 # Add the parent directory to Python path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from template_editor import get_base_path, load_config, process_template_generation, load_workbook
+from config_watcher import ConfigWatcher
+from label_index import get_label_index
+from metrics import GenerationMetrics
+from template_editor import (get_base_path, iter_rows, load_config, process_fanout_generation,
+                             process_template_generation)
+from verifier import VerificationError
+
+# Most entries shown in a picker's drop-down; typing narrows the list
+MAX_CHOICES = 200
+
+# How often config.json and the templates are checked for edits
+RELOAD_INTERVAL_MS = 2000
+
+# Keys that move through a picker rather than change its text
+_NAVIGATION_KEYS = ('Return', 'KP_Enter', 'Up', 'Down', 'Escape', 'Tab')
 
 class TemplateEditorApp:
     def __init__(self, root):
@@ -29,18 +51,33 @@ class TemplateEditorApp:
         
         # Variables
         self.config = None
+        self.catalogue = None
         self.template_vars = {}
         self.entries = {}
+        self.tables = {}
+        # Other templates to fill from the same form: name -> checkbox variable
+        self.fanout_vars = {}
+        # (category, template) the form was built for; the pickers' text can differ while typing
+        self.loaded_template = None
+        self.cancel_event = threading.Event()
+        self.generation_queue = queue.Queue()
+        self.generating = False
         
         # Set config path
         # Config file is in the Main/ directory, a subdirectory of the project root.
         self.config_path = os.path.join(str(Path(__file__).parent), 'config.json')
+        # Question labels are cached next to the config so the form opens without parsing the workbook
+        self.label_index = get_label_index(self.config_path)
         
         # Load configuration
         self.load_configuration()
         
         # Setup UI
         self.setup_ui()
+
+        # Edits to the config and templates are picked up without a restart
+        self.watcher = ConfigWatcher(self.config_path, self.config, self.label_index)
+        self.root.after(RELOAD_INTERVAL_MS, self.check_for_changes)
     
     def load_configuration(self):
         """Load the configuration file"""
@@ -49,6 +86,7 @@ class TemplateEditorApp:
             if not self.config or 'files' not in self.config:
                 messagebox.showerror("Error", "Invalid or empty configuration file.")
                 return False
+            self.catalogue = self.config['catalogue']
             return True
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load configuration: {str(e)}")
@@ -67,12 +105,14 @@ class TemplateEditorApp:
         self.category_combo = ttk.Combobox(
             main_frame,
             textvariable=self.category_var,
-            values=list(self.config['files'].keys()) if self.config else [],
-            state='readonly',
+            values=self.catalogue.search_categories(limit=MAX_CHOICES) if self.catalogue else [],
             font=('Arial', 10)
         )
         self.category_combo.pack(fill=tk.X, pady=(0, 10))
         self.category_combo.bind('<<ComboboxSelected>>', self.on_category_selected)
+        # Typing filters the list; Enter picks the typed name or the first match
+        self.category_combo.bind('<KeyRelease>', self.filter_categories)
+        self.category_combo.bind('<Return>', self.choose_category)
 
         # Template selection
         ttk.Label(main_frame, text="Select Template:", font=('Arial', 10, 'bold')).pack(anchor='w')
@@ -87,6 +127,8 @@ class TemplateEditorApp:
         )
         self.template_combo.pack(fill=tk.X, pady=(0, 10))
         self.template_combo.bind('<<ComboboxSelected>>', self.on_template_selected)
+        self.template_combo.bind('<KeyRelease>', self.filter_templates)
+        self.template_combo.bind('<Return>', self.choose_template)
         
         # Input frame (will be populated when template is selected)
         self.input_frame = ttk.Frame(main_frame)
@@ -151,6 +193,20 @@ class TemplateEditorApp:
             width=20
         )
         self.generate_btn.pack(side=tk.LEFT)
+
+        # Cancel button, enabled while a batch is running
+        self.cancel_btn = ttk.Button(
+            right_button_frame,
+            text="Cancel",
+            command=self.cancel_generation,
+            state=tk.DISABLED,
+            width=10
+        )
+        self.cancel_btn.pack(side=tk.LEFT, padx=(5, 0))
+
+        # Progress of the current batch
+        self.progress_bar = ttk.Progressbar(main_frame, mode='determinate')
+        self.progress_bar.pack(fill=tk.X, pady=(10, 0))
         
         # Status bar
         self.status_var = tk.StringVar()
@@ -168,32 +224,86 @@ class TemplateEditorApp:
         """When a category is selected, populate the templates combobox."""
         # Clear previous template selection and inputs
         self.template_var.set('')
+        self.loaded_template = None
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
         self.entries.clear()
+        self.tables.clear()
         self.generate_btn.config(state=tk.DISABLED)
         self.template_combo.config(values=[], state='disabled')
 
         # Get selected category
         category_name = self.category_var.get()
-        if not category_name or not self.config or 'files' not in self.config:
+        if not category_name or not self.config or category_name not in self.config.get('files', {}):
             return
 
         # Populate templates
-        templates = list(self.config['files'].get(category_name, {}).keys())
-        self.template_combo.config(values=templates, state='readonly' if templates else 'disabled')
+        templates = [name for _, name in self.catalogue.search_templates(category=category_name, limit=MAX_CHOICES)]
+        self.template_combo.config(values=templates, state='normal' if templates else 'disabled')
         self.update_status(f"Selected category: {category_name}")
 
-    def on_template_selected(self, event=None):
+    def filter_categories(self, event=None):
+        """Narrow the category drop-down to the names matching what has been typed"""
+        if not self.catalogue or (event is not None and event.keysym in _NAVIGATION_KEYS):
+            return
+        self.category_combo.config(values=self.catalogue.search_categories(self.category_var.get(), MAX_CHOICES))
+
+    def choose_category(self, event=None):
+        """Select the typed category, or the first one matching it"""
+        if not self.catalogue:
+            return
+        text = self.category_var.get()
+        if text not in self.config['files']:
+            matches = self.catalogue.search_categories(text, 1)
+            if not matches:
+                self.update_status(f"No category matches '{text}'")
+                return
+            self.category_var.set(matches[0])
+        self.on_category_selected()
+
+    def filter_templates(self, event=None):
+        """Narrow the template drop-down to the selected category's templates matching what has been typed"""
+        if not self.catalogue or (event is not None and event.keysym in _NAVIGATION_KEYS):
+            return
+        matches = self.catalogue.search_templates(self.template_var.get(), self.category_var.get(), MAX_CHOICES)
+        self.template_combo.config(values=[name for _, name in matches])
+
+    def choose_template(self, event=None):
+        """Select the typed template, or the first one matching it"""
+        if not self.catalogue:
+            return
+        category_name = self.category_var.get()
+        text = self.template_var.get()
+        if text not in self.config['files'].get(category_name, {}):
+            matches = self.catalogue.search_templates(text, category_name, 1)
+            if not matches:
+                self.update_status(f"No template matches '{text}'")
+                return
+            self.template_var.set(matches[0][1])
+        self.on_template_selected()
+
+    def on_template_selected(self, event=None, keep_values=False):
         """When a template is selected, load its fields"""
+        # Values typed and tables loaded survive a reload of the same template
+        typed = {cell: entry.get() for cell, entry in self.entries.items()} if keep_values else {}
+        loaded_tables = dict(self.tables) if keep_values else {}
+        checked = {name for name, var in self.fanout_vars.items() if var.get()} if keep_values else set()
+        self.fanout_vars.clear()
+
+        # A reload rebuilds the form that is showing, whatever is typed in the pickers
+        if keep_values and self.loaded_template:
+            category_name, template_name = self.loaded_template
+        else:
+            category_name, template_name = self.category_var.get(), self.template_var.get()
+        self.loaded_template = None
+
         # Clear previous inputs
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
         self.entries.clear()
+        self.tables.clear()
+        self.generate_btn.config(state=tk.DISABLED)
         
-        # Get selected category and template
-        category_name = self.category_var.get()
-        template_name = self.template_var.get()
         if not category_name or not template_name or not self.config or 'files' not in self.config:
             return
         
@@ -209,12 +319,12 @@ class TemplateEditorApp:
                 self.update_status("Error: Template file not found")
                 return
                 
-            workbook = load_workbook(excel_path, data_only=True)
+            labels = self.label_index.labels_for(excel_path, template_config['mappings'])
             
             # Add input fields
             for i, (key, value) in enumerate(template_config['mappings'].items()):
                 # Get the question text from the key cell
-                question = self.get_cell_value(workbook, key)
+                question = labels[key]
                 
                 # Create a frame for this input
                 frame = ttk.Frame(self.scrollable_frame, padding=5)
@@ -226,9 +336,42 @@ class TemplateEditorApp:
                 
                 # Add entry field
                 entry = ttk.Entry(frame)
+                entry.insert(0, typed.get(value, ''))
                 entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
                 self.entries[value] = entry  # Use the coordinate as the key
+
+            # Tables are filled from a CSV/JSONL file rather than typed in
+            for table_name in template_config['spec'].tables:
+                if table_name in loaded_tables:
+                    self.tables[table_name] = loaded_tables[table_name]
+                frame = ttk.Frame(self.scrollable_frame, padding=5)
+                frame.pack(fill=tk.X, pady=2)
+                ttk.Label(frame, text=f"{table_name}:", width=40, anchor='w').pack(
+                    side=tk.LEFT, padx=(0, 5), fill=tk.X, expand=True)
+                rows_var = tk.StringVar(
+                    value=f"{len(self.tables[table_name])} rows" if table_name in self.tables else "No rows")
+                ttk.Label(frame, textvariable=rows_var).pack(side=tk.LEFT, padx=(0, 5))
+                ttk.Button(
+                    frame,
+                    text="Load table...",
+                    command=lambda name=table_name, var=rows_var: self.load_table(name, var)
+                ).pack(side=tk.LEFT)
+
+            # Templates answered by the same cells can be generated from this form in one go
+            answer_cells = set(template_config['mappings'].values())
+            others = [
+                name for name, details in self.config['files'][category_name].items()
+                if name != template_name and set(details['mappings'].values()) <= answer_cells
+            ]
+            if others:
+                ttk.Label(self.scrollable_frame, text="Also generate:", font=('Arial', 10, 'bold')).pack(
+                    anchor='w', pady=(10, 0))
+                for name in others[:MAX_CHOICES]:
+                    var = tk.BooleanVar(value=name in checked)
+                    ttk.Checkbutton(self.scrollable_frame, text=name, variable=var).pack(anchor='w', padx=5)
+                    self.fanout_vars[name] = var
             
+            self.loaded_template = (category_name, template_name)
             self.generate_btn.config(state=tk.NORMAL)
             self.update_status(f"Loaded template: {template_name}")
             
@@ -236,28 +379,28 @@ class TemplateEditorApp:
             messagebox.showerror("Error", f"Failed to load template: {str(e)}")
             self.update_status("Error loading template")
     
-    def get_cell_value(self, workbook, cell_ref):
-        """Get value from a cell reference in the workbook"""
+    def load_table(self, table_name, rows_var):
+        """Read a table's rows from a CSV or JSONL file"""
+        file_path = askopenfilename(
+            title=f"Rows for {table_name}",
+            filetypes=[("CSV files", "*.csv"), ("JSON lines", "*.jsonl"), ("All files", "*.*")]
+        )
+        if not file_path:
+            return
         try:
-            if '!' in cell_ref:
-                sheet_name, cell = cell_ref.split('!')
-                sheet = workbook[sheet_name]
-            else:
-                sheet = workbook.active
-                cell = cell_ref
-            return str(sheet[cell].value or "")
-        except Exception:
-            return cell_ref  # Return the cell reference if can't read the cell
-    
+            self.tables[table_name] = list(iter_rows(file_path))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to read table: {str(e)}")
+            return
+        rows_var.set(f"{len(self.tables[table_name])} rows")
+
     def generate_document(self):
         """Generate the document(s) with the user's input"""
-        # Get template info
-        category_name = self.category_var.get()
-        template_name = self.template_var.get()
-        
-        if not category_name or not template_name:
+        # The template the form was built for, not whatever is typed in the pickers now
+        if not self.loaded_template:
             messagebox.showerror("Error", "Please select a category and a template.")
             return
+        category_name, template_name = self.loaded_template
 
         # Get user inputs
         results = {key: entry.get() for key, entry in self.entries.items()}
@@ -277,47 +420,165 @@ class TemplateEditorApp:
             messagebox.showerror("Error", "Please select a save location first.")
             return
         
+        template_names = [template_name] + [name for name, var in self.fanout_vars.items() if var.get()]
+
+        self.update_status("Generating documents...")
+        self.generating = True
+        self.generate_btn.config(state=tk.DISABLED)
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.progress_bar.config(maximum=quantity * len(template_names), value=0)
+
+        # Run the batch on a worker thread; it reports back through the queue
+        self.cancel_event = threading.Event()
+        self.generation_queue = queue.Queue()
+        worker = threading.Thread(
+            target=self.run_generation,
+            args=(category_name, template_names, results, quantity, os.path.dirname(save_path), dict(self.tables)),
+            daemon=True
+        )
+        worker.start()
+        self.root.after(100, self.poll_generation)
+
+    def run_generation(self, category_name, template_names, results, quantity, output_dir, tables=None):
+        """Worker thread body: generate the documents of one or more templates and post the outcome to the queue"""
+        # An optional "metrics_log" entry in config.json keeps a JSON-lines record of every batch
+        log_path = self.config.get('metrics_log')
+        if log_path and not os.path.isabs(log_path):
+            log_path = os.path.join(os.path.dirname(self.config_path), log_path)
+        metrics = GenerationMetrics(log_path)
+        options = dict(
+            progress=lambda done, total, path: self.generation_queue.put(('progress', done, total)),
+            cancel_event=self.cancel_event,
+            metrics=metrics,
+            tables=tables or None,
+            # An optional "writer_profile" entry picks the output compression (see xlsx_writer.py)
+            profile=self.config.get('writer_profile', 'default'),
+            # and "output_layout" how the output directory is organised (see OUTPUT_LAYOUTS)
+            layout=self.config.get('output_layout', 'flat'),
+            # and "verify_output": true reads every document back once written (see verifier.py)
+            verify=bool(self.config.get('verify_output', False))
+        )
         try:
-            self.update_status("Generating documents...")
-            self.root.update_idletasks() # Force UI update
-
-            # Process the template generation
-            generated_files = process_template_generation(
-                self.config,
-                self.config_path,
-                category_name,
-                template_name,
-                results,
-                quantity,
-                os.path.dirname(save_path) # Pass the directory
-            )
-            
+            if len(template_names) > 1:
+                generated_files = process_fanout_generation(
+                    self.config, self.config_path, category_name, template_names, results, quantity, output_dir,
+                    **options
+                )
+            else:
+                generated_files = process_template_generation(
+                    self.config, self.config_path, category_name, template_names[0], results, quantity, output_dir,
+                    **options
+                )
+            metrics.finish(category=category_name, template=', '.join(template_names), quantity=quantity)
+            total = quantity * len(template_names)
+            self.generation_queue.put(('done', generated_files, total, metrics.format_summary()))
+        except VerificationError as e:
+            # The batch itself is finished; only reading it back found problems
+            metrics.finish(category=category_name, template=', '.join(template_names), quantity=quantity)
+            total = quantity * len(template_names)
+            self.generation_queue.put(('done', e.files, total, metrics.format_summary(), e.report))
+        except Exception as e:
+            self.generation_queue.put(('error', e))
+
+    def poll_generation(self):
+        """Apply messages from the worker thread; runs on the Tk main thread"""
+        try:
+            while True:
+                message = self.generation_queue.get_nowait()
+                if message[0] == 'progress':
+                    _, done, total = message
+                    self.progress_bar.config(value=done)
+                    self.update_status(f"Generated {done} of {total} document(s)...")
+                elif message[0] == 'done':
+                    self.finish_generation(*message[1:])
+                    return
+                else:
+                    self.generating = False
+                    self.cancel_btn.config(state=tk.DISABLED)
+                    self.generate_btn.config(state=tk.NORMAL)
+                    messagebox.showerror(
+                        "Error",
+                        f"Failed to generate document: {str(message[1])}\n\n"
+                        "Generate again with the same details to resume from the first missing document."
+                    )
+                    self.update_status("Error generating document")
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(100, self.poll_generation)
+
+    def cancel_generation(self):
+        """Ask the worker to stop after the file it is currently writing"""
+        self.cancel_event.set()
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.update_status("Cancelling...")
+
+    def finish_generation(self, generated_files, quantity, metrics_summary, report=None):
+        """Report the result of a finished or cancelled batch, and of its verification if it failed, and reset the form"""
+        self.generating = False
+        self.cancel_btn.config(state=tk.DISABLED)
+        if len(generated_files) < quantity:
+            success_message = f"Cancelled after generating {len(generated_files)} of {quantity} document(s)."
+        else:
             success_message = f"Successfully generated {len(generated_files)} document(s)."
-            if len(generated_files) < 11:
-                success_message += "\n\n" + "\n".join([os.path.basename(f) for f in generated_files])
+        if len(generated_files) < 11:
+            success_message += "\n\n" + "\n".join([os.path.basename(f) for f in generated_files])
 
-            self.update_status(success_message)
+        self.update_status(success_message)
+        if report is not None:
+            messagebox.showwarning(
+                "Verification Failed",
+                f"{success_message}\n\nReading them back found problems:\n{report.format(limit=10)}"
+            )
+        else:
             messagebox.showinfo("Success", success_message)
 
-            # Reset UI after success
-            self.category_var.set('')
+        # Reset UI after success
+        self.category_var.set('')
+        self.template_var.set('')
+        self.loaded_template = None
+        self.template_combo.config(values=[], state='disabled')
+        for widget in self.scrollable_frame.winfo_children():
+            widget.destroy()
+        self.entries.clear()
+        self.tables.clear()
+        self.generate_btn.config(state=tk.DISABLED)
+        self.quantity_var.set('1')
+        self.progress_bar.config(value=0)
+        self.update_status(metrics_summary)
+    
+    def check_for_changes(self):
+        """Pick up edits to config.json and the templates; reschedules itself"""
+        # While a batch runs the form is left alone; edits are picked up once it finishes
+        if not self.generating:
+            changes = self.watcher.check()
+            if changes.config_reloaded:
+                self.config = self.watcher.config
+                self.catalogue = self.config['catalogue']
+                self.refresh_pickers()
+            if self.loaded_template in changes.templates:
+                # Rebuilds the form, or clears it if the template was removed
+                self.on_template_selected(keep_values=True)
+            if changes.config_reloaded or changes.templates:
+                self.update_status(f"Reloaded {len(changes.templates)} changed template(s)")
+        self.root.after(RELOAD_INTERVAL_MS, self.check_for_changes)
+
+    def refresh_pickers(self):
+        """Re-filter both pickers against the reloaded catalogue"""
+        self.filter_categories()
+        if self.category_var.get() in self.config.get('files', {}):
+            self.filter_templates()
+            self.template_combo.config(state='normal')
+        else:
+            # The selected category was removed (or is still being typed)
             self.template_var.set('')
             self.template_combo.config(values=[], state='disabled')
-            for widget in self.scrollable_frame.winfo_children():
-                widget.destroy()
-            self.entries.clear()
-            self.generate_btn.config(state=tk.DISABLED)
-            self.quantity_var.set('1')
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate document: {str(e)}")
-            self.update_status("Error generating document")
-    
+
     def browse_save_location(self):
         """Open a dialog to choose save location"""
-        template_name = self.template_var.get()
-        if not template_name:
+        if not self.loaded_template:
             return
+        template_name = self.loaded_template[1]
             
         # Suggest a default filename
         default_name = f"{template_name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
@@ -338,9 +599,22 @@ class TemplateEditorApp:
         self.status_var.set(message)
         self.root.update_idletasks()
 
+def report_startup_timing(stages):
+    """Print how long each startup stage took, for the --startup-timing flag."""
+    print("Startup timing:")
+    previous = STARTED_AT
+    for name, finished_at in stages:
+        print(f"  {name:<16}{(finished_at - previous) * 1000:8.1f} ms")
+        previous = finished_at
+    print(f"  {'total':<16}{(previous - STARTED_AT) * 1000:8.1f} ms")
+    print(f"  openpyxl loaded: {'yes' if 'openpyxl' in sys.modules else 'no'}")
+
 def main():
+    stages = [("imports", time.perf_counter())]
     root = tk.Tk()
+    stages.append(("Tk init", time.perf_counter()))
     app = TemplateEditorApp(root)
+    stages.append(("build window", time.perf_counter()))
     
     # Center the window
     window_width = 800
@@ -350,8 +624,16 @@ def main():
     x = (screen_width // 2) - (window_width // 2)
     y = (screen_height // 2) - (window_height // 2)
     root.geometry(f'{window_width}x{window_height}+{x}+{y}')
+
+    if '--startup-timing' in sys.argv:
+        # Force the first paint so it is included in the report
+        root.update()
+        stages.append(("first paint", time.perf_counter()))
+        report_startup_timing(stages)
     
     root.mainloop()
 
 if __name__ == "__main__":
+    # Needed for the process pool used by parallel generation in frozen builds
+    multiprocessing.freeze_support()
     main()
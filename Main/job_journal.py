@@ -0,0 +1,198 @@
+"""
+File name: job_journal.py
+Job Journal - Records the progress of a generation batch so it can be resumed
+
+Each batch writes a journal to jobs/ next to config.json. The first line holds
+the request and the serial numbers reserved for it, and one line is appended
+per finished file. The journal is removed once the batch completes or is
+cancelled, so a journal left behind belongs to a batch that died part way
+(crash, full disk, sleep). Running the same request again, or
+`cli.py resume`, continues it from the first missing document.
+
+The run working on a journal holds an OS lock on a companion .lock file for
+as long as it runs, so a journal that is still being written is never taken
+for an interrupted one: a second identical request started meanwhile gets a
+journal and serial numbers of its own. The lock goes with the process, so a
+crash leaves the journal free to resume.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from typing import Dict, List
+
+from serial_ledger import FileLock
+
+JOBS_DIRNAME = 'jobs'
+
+def jobs_dir(config_path: str) -> str:
+    """Directory holding the journals of the batches generated with a config file."""
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), JOBS_DIRNAME)
+
+def job_id(request: Dict) -> str:
+    """Stable identifier for a request; the same request always maps to the same journal."""
+    text = json.dumps(request, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+class GenerationJob:
+    """Journal of one batch: its request, reserved serial numbers and finished files."""
+
+    def __init__(self, path: str, header: Dict, completed: Dict[int, str] = None):
+        self.path = path
+        self.request = header['request']
+        self.options = header.get('options', {})
+        self.base_serial = header['base_serial']
+        self.first_count = header['first_count']
+        self.completed = completed or {}  # index -> output path
+        self._file = None
+        self._lock = None
+
+    @property
+    def last_count(self) -> int:
+        """Highest serial count reserved for the batch."""
+        return self.first_count + self.request['quantity'] - 1
+
+    @classmethod
+    def create(cls, directory: str, request: Dict, options: Dict, base_serial: str, first_count: int):
+        """Start the journal for a new batch, held by this run."""
+        os.makedirs(directory, exist_ok=True)
+        header = {'request': request, 'options': options, 'base_serial': base_serial, 'first_count': first_count}
+        # Unique, since an identical request may be running alongside
+        path = os.path.join(directory, f"{job_id(request)}-{uuid.uuid4().hex[:8]}.jsonl")
+        job = cls(path, header)
+        job._lock = FileLock(path + '.lock')
+        job._lock.acquire()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return job
+
+    @classmethod
+    def load(cls, path: str):
+        """Read a journal back, ignoring a torn final line."""
+        with open(path, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            completed = {}
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                completed[record['index']] = record['path']
+        return cls(path, header, completed)
+
+    def claim(self) -> bool:
+        """Hold the journal for this run; False if another run, in any process, holds it or it is gone."""
+        if self._lock is None:
+            self._lock = _try_lock(self.path)
+        return self._lock is not None
+
+    def reconcile(self) -> Dict[int, str]:
+        """Forget finished files that are no longer in the output directory."""
+        self.completed = {index: path for index, path in self.completed.items() if os.path.exists(path)}
+        return self.completed
+
+    def record(self, index: int, serial_number: str, path: str):
+        """Note that the file at a batch position has been written."""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        path = os.path.abspath(path)
+        self._file.write(json.dumps({'index': index, 'serial': serial_number, 'path': path}) + '\n')
+        # Flushed but not fsync'd: the output files are not fsync'd either, and
+        # this already survives the process dying
+        self._file.flush()
+        self.completed[index] = path
+
+    def close(self):
+        """Stop writing and let go of the journal, leaving it to be resumed."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+
+    def remove(self):
+        """Delete the journal of a batch that completed or was cancelled."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        # Removed before the lock is let go, so no one can claim a finished journal
+        self.close()
+        try:
+            os.remove(self.path + '.lock')
+        except OSError:
+            # Still open elsewhere (Windows); it is just an empty file
+            pass
+
+def _load_or_warn(path: str):
+    try:
+        return GenerationJob.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Ignoring damaged job journal {path}: {e}")
+        return None
+
+def _journal_paths(directory: str, prefix: str = '') -> List[str]:
+    """Journals in a directory whose names start with prefix, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    paths = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith('.jsonl'):
+            path = os.path.join(directory, name)
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except OSError:
+                # Removed by the run that finished it
+                continue
+    return [path for _, path in sorted(paths)]
+
+def _try_lock(path: str):
+    """The lock of a journal if no one else holds it and the journal still exists, else None."""
+    lock = FileLock(path + '.lock', blocking=False)
+    try:
+        lock.acquire()
+    except OSError:
+        return None
+    if not os.path.exists(path):
+        # Completed and removed by the run that held it
+        lock.release()
+        return None
+    return lock
+
+def _claim(path: str):
+    """Load and hold a journal nobody else holds, or return None."""
+    lock = _try_lock(path)
+    if lock is None:
+        return None
+    job = _load_or_warn(path)
+    if job is None:
+        lock.release()
+        return None
+    job._lock = lock
+    return job
+
+def find_job(directory: str, request: Dict):
+    """Return an interrupted batch's journal for a request, held by this run, or None."""
+    for path in _journal_paths(directory, job_id(request)):
+        job = _claim(path)
+        if job is not None:
+            return job
+    return None
+
+def unfinished_jobs(directory: str) -> List[GenerationJob]:
+    """Every journal left behind by an interrupted batch, oldest first; journals of running batches are left out."""
+    jobs = []
+    for path in _journal_paths(directory):
+        job = _claim(path)
+        if job is not None:
+            # Only looked at here; whoever resumes it claims it again
+            job.close()
+            jobs.append(job)
+    return jobs
@@ -0,0 +1,132 @@
+"""
+File name: label_index.py
+Label Index - Persistent cache of the question text shown for each template
+
+Rendering a template's form only needs the text in its question cells (B3..B8
+etc.), so those strings are stored next to config.json. An entry is reused
+while the template's mtime and size match; if they changed, the file is hashed
+and only re-read when its content actually differs.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable
+
+LABEL_INDEX_FILENAME = 'template_labels.json'
+
+def file_sha256(path: str) -> str:
+    """Hash a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_labels(template_path: str, cell_refs: Iterable[str]) -> Dict[str, str]:
+    """Read the text of each cell from the workbook; unreadable cells fall back to their reference."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(template_path, read_only=True, data_only=True)
+    try:
+        labels = {}
+        for cell_ref in cell_refs:
+            try:
+                if '!' in cell_ref:
+                    sheet_name, cell = cell_ref.split('!')
+                    sheet = workbook[sheet_name]
+                else:
+                    sheet = workbook.active
+                    cell = cell_ref
+                value = sheet[cell].value
+                labels[cell_ref] = "" if value is None else str(value)
+            except Exception:
+                labels[cell_ref] = cell_ref
+        return labels
+    finally:
+        workbook.close()
+
+class LabelIndex:
+    """Template path -> question labels, validated by mtime, size and content hash."""
+
+    def __init__(self, path: str = None):
+        # With no path the index lives in memory only
+        self.path = path
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                # A damaged index is simply rebuilt
+                self._entries = {}
+
+    def labels_for(self, template_path: str, cell_refs: Iterable[str]) -> Dict[str, str]:
+        """Return the labels for the given question cells, rebuilding the entry if stale."""
+        cell_refs = list(cell_refs)
+        with self._lock:
+            entry, status = self._validate(template_path, cell_refs)
+            if status:
+                self._save()
+            return {ref: entry['labels'][ref] for ref in cell_refs}
+
+    def invalidate(self, template_path: str = None):
+        """Forget one template's labels, or all of them."""
+        with self._lock:
+            if template_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(template_path, None)
+            self._save()
+
+    def _validate(self, template_path: str, cell_refs: Iterable[str]):
+        """
+        Return (entry, status) for a template, re-reading the workbook only if needed.
+
+        status is None when the entry was fresh, 'stat' when only the file's
+        stat was updated and 'read' when labels were read from the workbook.
+        """
+        stat = os.stat(template_path)
+        entry = self._entries.get(template_path)
+        covers_refs = entry is not None and all(ref in entry['labels'] for ref in cell_refs)
+        if covers_refs and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return entry, None
+
+        content_hash = file_sha256(template_path)
+        if covers_refs and entry['sha256'] == content_hash:
+            # Touched but not modified; just record the new stat
+            entry['mtime_ns'], entry['size'] = stat.st_mtime_ns, stat.st_size
+            return entry, 'stat'
+
+        labels = dict(entry['labels']) if entry and entry['sha256'] == content_hash else {}
+        missing = [ref for ref in cell_refs if ref not in labels]
+        labels.update(read_labels(template_path, missing))
+        entry = {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': content_hash,
+            'labels': labels,
+        }
+        self._entries[template_path] = entry
+        return entry, 'read'
+
+    def _save(self):
+        if not self.path:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(temp_path, self.path)
+
+_indexes: Dict[str, LabelIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_label_index(config_path: str) -> LabelIndex:
+    """Return the label index stored next to a config file."""
+    path = os.path.join(os.path.dirname(os.path.abspath(config_path)), LABEL_INDEX_FILENAME)
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = LabelIndex(path)
+        return _indexes[path]
@@ -0,0 +1,87 @@
+"""
+File name: manifest.py
+Record Manifest - Generated documents kept as records until they are needed
+
+The 'manifest' output mode issues serial numbers without rendering anything:
+each document becomes one JSON line in manifest.jsonl in the output directory,
+holding the template, the template's SHA-256 at the time, the serial number
+and the filled-in values. render_manifest (template_editor.py) or
+`cli.py render` turns any subset of the records into XLSX files later.
+
+Tables (see template_spec.py) are stored once per batch in a record of their
+own, which the batch's documents refer to by hash.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List
+
+MANIFEST_FILENAME = 'manifest.jsonl'
+
+def manifest_record(category: str, template: str, template_hash: str, serial_number: str,
+                    values: Dict[str, str], filename: str, tables_hash: str = None) -> Dict:
+    """One document's record."""
+    record = {
+        'category': category,
+        'template': template,
+        'template_sha256': template_hash,
+        'serial': serial_number,
+        'values': values,
+        'file': filename,
+    }
+    if tables_hash:
+        record['tables_sha256'] = tables_hash
+    return record
+
+def tables_record(tables: Dict[str, List[Dict[str, str]]]) -> Dict:
+    """A record holding the tables shared by a batch's documents."""
+    text = json.dumps(tables, sort_keys=True)
+    return {'tables_sha256': hashlib.sha256(text.encode('utf-8')).hexdigest(), 'tables': tables}
+
+def append_records(path: str, records: Iterable[Dict]) -> int:
+    """Append records to a manifest in one durable write; returns the bytes written."""
+    data = ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'ab') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(data)
+
+def read_records(path: str, serial_numbers: Iterable[str] = None) -> List[Dict]:
+    """
+    Read a manifest's records in the order they were issued.
+
+    A serial number recorded twice (a resumed batch) keeps its latest record.
+    With serial_numbers, only those records are returned, and a serial number
+    that is not in the manifest raises ValueError. Records of documents with
+    tables get them back under 'tables'.
+    """
+    records: Dict[str, Dict] = {}
+    shared_tables: Dict[str, Dict] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line torn by a crash mid-append is ignored
+                continue
+            if 'serial' not in record:
+                shared_tables[record['tables_sha256']] = record['tables']
+                continue
+            records.pop(record['serial'], None)
+            records[record['serial']] = record
+
+    if serial_numbers is None:
+        selected = list(records.values())
+    else:
+        wanted = list(serial_numbers)
+        missing = [serial for serial in wanted if serial not in records]
+        if missing:
+            raise ValueError(f"Not in {os.path.basename(path)}: {', '.join(missing)}")
+        selected = [records[serial] for serial in wanted]
+    for record in selected:
+        if 'tables_sha256' in record:
+            record['tables'] = shared_tables[record['tables_sha256']]
+    return selected
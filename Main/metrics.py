@@ -0,0 +1,114 @@
+"""
+File name: metrics.py
+Generation Metrics - Per-stage timings and throughput for a generation batch
+
+A GenerationMetrics object is passed to process_template_generation (and
+from there to the per-file writers), which time their stages with
+`metrics.stage(name)`. At the end of the batch the summary can be appended to
+a structured JSON-lines log and shown in the GUI status bar.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict
+
+class GenerationMetrics:
+    """Collects stage durations, bytes written and file counts for one batch."""
+
+    def __init__(self, log_path: str = None):
+        self.log_path = log_path
+        self.stages: Dict[str, list] = {}  # name -> [count, total seconds]
+        self.files = 0
+        self.bytes_written = 0
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled; a fresh one is made on the other side
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the body of a with-block as one occurrence of a stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+
+    def add_stage(self, name: str, seconds: float, count: int = 1):
+        with self._lock:
+            totals = self.stages.setdefault(name, [0, 0.0])
+            totals[0] += count
+            totals[1] += seconds
+
+    def add_output(self, size: int):
+        """Record one finished document of the given size in bytes."""
+        with self._lock:
+            self.files += 1
+            self.bytes_written += size
+
+    def merge(self, other: 'GenerationMetrics'):
+        """Fold in the measurements taken by another collector, e.g. in a worker process."""
+        for name, (count, seconds) in other.stages.items():
+            self.add_stage(name, seconds, count)
+        with self._lock:
+            self.files += other.files
+            self.bytes_written += other.bytes_written
+
+    def summary(self) -> Dict:
+        """Aggregated figures for the batch."""
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return {
+            'files': self.files,
+            'bytes_written': self.bytes_written,
+            'elapsed_seconds': round(elapsed, 6),
+            'files_per_second': round(self.files / elapsed, 2) if elapsed else 0.0,
+            'stages': {
+                name: {
+                    'count': count,
+                    'total_seconds': round(seconds, 6),
+                    'mean_ms': round(seconds / count * 1000, 3) if count else 0.0,
+                }
+                for name, (count, seconds) in self.stages.items()
+            },
+        }
+
+    def format_summary(self) -> str:
+        """One-line summary suitable for a status bar."""
+        summary = self.summary()
+        stage_total = sum(stage['total_seconds'] for stage in summary['stages'].values()) or 1
+        slowest = sorted(summary['stages'].items(), key=lambda item: -item[1]['total_seconds'])[:3]
+        text = (f"{summary['files']} file(s) in {summary['elapsed_seconds']:.2f} s "
+                f"({summary['files_per_second']:.1f} files/s, "
+                f"{summary['bytes_written'] / 1024:.0f} KB)")
+        if slowest:
+            text += " - " + ", ".join(
+                f"{name} {stage['total_seconds'] / stage_total:.0%}" for name, stage in slowest
+            )
+        return text
+
+    def finish(self, **context) -> Dict:
+        """Close the batch, append its summary to the log file if one is set, and return it."""
+        self.finished_at = time.perf_counter()
+        record = {'timestamp': datetime.now().isoformat(timespec='seconds'), **context, **self.summary()}
+        if self.log_path:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+        return record
+
+def measured_call(task, args):
+    """Run task(*args) with a fresh collector; used to bring timings back from worker processes."""
+    metrics = GenerationMetrics()
+    result = task(*args, metrics=metrics)
+    return result, metrics
@@ -0,0 +1,262 @@
+"""
+File name: serial_ledger.py
+Serial Ledger - Crash-safe storage for serial number counters
+
+Counters live in an append-only journal next to config.json instead of in
+config.json itself. Each update appends one fsync'd line, and the journal is
+periodically compacted into a fresh file that atomically replaces it. The
+compacted file starts with a header line holding a generation number, raised
+by every compaction, so other processes know to read it again from the
+start (an inode or size check is not enough: the file system may reuse the
+old inode, and the new file can be as long as the old one). As
+described in Docs/Brief_220725.md, only the most recently used serial numbers
+are kept; the oldest entries are evicted once the limit is reached.
+
+Every read and update takes an OS file lock and first picks up whatever other
+processes (a second GUI on a shared drive, the CLI, the service) have
+written, so reserve() never hands out a serial number twice while its base
+serial number is remembered. Once a base serial number has been evicted its
+counting starts again at 1, so its serial numbers are issued again (the
+document index keeps both documents; see document_index.py).
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+LEDGER_FILENAME = 'serial_numbers.jsonl'
+
+# Number of serial numbers remembered before the oldest are evicted
+MAX_ENTRIES = 75
+
+class FileLock:
+    """Exclusive lock shared between processes, held on a companion lock file."""
+
+    def __init__(self, path: str, blocking: bool = True):
+        self.path = path
+        self.blocking = blocking
+        self._file = None
+
+    def acquire(self):
+        """Take the lock; without blocking, raise OSError at once if someone else holds it."""
+        self._file = open(self.path, 'a+')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._file.seek(0)
+                # LK_LOCK retries for about ten seconds before giving up with OSError
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK if self.blocking else msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BaseException:
+            self._file.close()
+            self._file = None
+            raise
+
+    def release(self):
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class SerialLedger:
+    """Bounded, journaled mapping of base serial number -> times used."""
+
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES, seed: Dict[str, int] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self._counts: OrderedDict = OrderedDict()
+        self._journal_lines = 0
+        # Generation of the journal file and how far into it has been read
+        self._generation = None
+        self._offset = 0
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + '.lock')
+
+        with self._locked():
+            if not os.path.exists(path) and seed:
+                # First run: migrate the counters previously stored in config.json
+                for serial, count in seed.items():
+                    self._apply(str(serial), int(count))
+                self._compact_locked()
+
+    @contextmanager
+    def _locked(self):
+        """Hold both the thread lock and the file lock, with the counters brought up to date."""
+        with self._lock, self._file_lock:
+            self._sync_locked()
+            yield
+
+    def _sync_locked(self):
+        """Read the lines appended since the last read, or everything if the journal was compacted."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            generation = _read_generation(f)
+            size = os.fstat(f.fileno()).st_size
+            if generation != self._generation or size < self._offset:
+                # Compacted by another process; start over
+                self._counts.clear()
+                self._journal_lines = 0
+                self._offset = 0
+                self._generation = generation
+            if size == self._offset:
+                return
+            f.seek(self._offset)
+            data = f.read()
+        # Everything up to the last newline; a torn final line is left unread
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line torn by a crash mid-append is ignored
+                continue
+            if 'serial' not in record:
+                # The generation header
+                continue
+            self._apply(record['serial'], record['count'])
+            self._journal_lines += 1
+        self._offset += end
+
+    def _apply(self, serial: str, count: int):
+        """Record a count in memory, evicting the oldest entries past the limit."""
+        self._counts[serial] = count
+        self._counts.move_to_end(serial)
+        while len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+
+    def _append_locked(self, counts: Dict[str, int]):
+        """Durably record new counts, all in one write."""
+        for serial, count in counts.items():
+            self._apply(serial, count)
+        with open(self.path, 'ab') as f:
+            # Only a crashed writer can have left an unterminated line, since the lock is held
+            prefix = b'\n' if f.tell() > self._offset else b''
+            lines = ''.join(json.dumps({'serial': serial, 'count': count}) + '\n' for serial, count in counts.items())
+            f.write(prefix + lines.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            self._offset = f.tell()
+        if self._generation is None:
+            # The journal did not exist before this write
+            self._generation = 0
+        self._journal_lines += len(counts)
+
+        # Superseded and evicted lines are dropped once they outnumber live ones
+        if self._journal_lines > 2 * self.max_entries:
+            self._compact_locked()
+
+    def get(self, serial: str) -> int:
+        """Return how many times a serial number has been used (0 if never)."""
+        with self._locked():
+            return self._counts.get(serial, 0)
+
+    def advance(self, serial: str, count: int):
+        """Raise a counter to count if it is lower; it never moves backwards."""
+        with self._locked():
+            if count > self._counts.get(serial, 0):
+                self._append_locked({serial: count})
+
+    def reserve(self, serial: str, quantity: int) -> Tuple[int, int]:
+        """
+        Claim the next quantity counts of a serial number in one locked step.
+
+        Returns the first and last count of the block, e.g. (6, 105) for
+        100-6..100-105. No other caller, in this or any other process, is
+        given a count from the block.
+        """
+        return self.reserve_blocks([(serial, quantity)])[0]
+
+    def reserve_blocks(self, requests: List[Tuple[str, int]]) -> List[Tuple[int, int]]:
+        """
+        Claim several blocks, e.g. one per template of a fan-out, in one locked write.
+
+        requests lists (serial, quantity) pairs; blocks of the same serial
+        number follow each other in request order. Returns each block's
+        first and last count.
+        """
+        if any(quantity < 1 for _, quantity in requests):
+            raise ValueError("Quantity must be at least 1.")
+        with self._locked():
+            counts = {}
+            blocks = []
+            for serial, quantity in requests:
+                first = counts.get(serial, self._counts.get(serial, 0)) + 1
+                counts[serial] = first + quantity - 1
+                blocks.append((first, first + quantity - 1))
+            self._append_locked(counts)
+            return blocks
+
+    def release(self, serial: str, first: int, last: int, used: int) -> bool:
+        """
+        Hand back the unused tail of a reserved block, e.g. after a cancelled batch.
+
+        Only possible while nothing has been reserved after the block; otherwise
+        the unused counts are left as a gap. Returns whether they were returned.
+        """
+        with self._locked():
+            if used >= last - first + 1 or self._counts.get(serial, 0) != last:
+                return False
+            self._append_locked({serial: first - 1 + used})
+            return True
+
+    def _compact_locked(self):
+        generation = (self._generation or 0) + 1
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'generation': generation}) + '\n')
+            for serial, count in self._counts.items():
+                f.write(json.dumps({'serial': serial, 'count': count}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(temp_path, self.path)
+        self._generation = generation
+        self._offset = size
+        self._journal_lines = len(self._counts)
+
+def _read_generation(f) -> int:
+    """The generation in a journal's header line; 0 for a journal never compacted."""
+    f.seek(0)
+    try:
+        header = json.loads(f.readline())
+    except json.JSONDecodeError:
+        return 0
+    return int(header.get('generation', 0)) if isinstance(header, dict) else 0
+
+_ledgers: Dict[str, SerialLedger] = {}
+_ledgers_lock = threading.Lock()
+
+def get_ledger(config_path: str, config: Dict = None) -> SerialLedger:
+    """
+    Return the ledger that belongs to a config file, opening it on first use.
+
+    Any 'serial_numbers' left in the config seed the ledger when it is created.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(config_path)), LEDGER_FILENAME)
+    with _ledgers_lock:
+        if path not in _ledgers:
+            seed = (config or {}).get('serial_numbers')
+            _ledgers[path] = SerialLedger(path, seed=seed)
+        return _ledgers[path]
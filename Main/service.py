@@ -0,0 +1,239 @@
+"""
+File name: service.py
+Generation Service - Long-lived local HTTP server with warm templates
+
+The server keeps the config and the parsed templates in memory and runs
+generation requests on a bounded thread pool, so clients skip interpreter
+start-up, the openpyxl import and template parsing. It only listens on
+localhost, and only answers requests addressed to localhost with a JSON body,
+so a web page open in the operator's browser cannot use it to write files (a
+cross-site form post cannot send JSON, and DNS rebinding is caught by the
+Host check). Edits to config.json and the templates are picked up while it
+runs (see config_watcher.py).
+
+Endpoints:
+    GET  /health     - {"status": "ok", "templates": N}
+    GET  /templates  - {category: [template names]}
+    POST /generate   - body mirrors process_template_generation's arguments:
+                       {"category", "template", "inputs", "quantity",
+                        "output_dir", optional "engine", "output_mode",
+                        "workers", "compresslevel", "tables", "profile",
+                        "layout", "verify"};
+                       a "templates" list instead fans the inputs out to
+                       several templates (see process_fanout_generation);
+                       "workers" is capped at the service's --workers
+                       returns {"files": [...], "summary": {...}}, or
+                       status 422 with {"error", "files", "verification"}
+                       if the batch was written but failed verification
+"""
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from config_watcher import DEFAULT_INTERVAL, ConfigWatcher
+from metrics import GenerationMetrics
+from verifier import VerificationError, VerificationReport
+from template_editor import (layout_cache, load_config, process_fanout_generation, process_template_generation,
+                             workbook_cache, zip_cache)
+
+HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Names a request's Host header may give, with or without a port
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '[::1]')
+
+class GenerationService:
+    """Warm config plus a bounded pool that runs generation requests."""
+
+    def __init__(self, config_path: str, workers: int = 4, engine: str = 'xml'):
+        self.config_path = config_path
+        self.config = load_config(config_path)
+        self.engine = engine
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        # Requests beyond this many waiting or running are turned away
+        self.slots = threading.BoundedSemaphore(workers * 4)
+        self.watcher = ConfigWatcher(config_path, self.config)
+        self.stop_event = threading.Event()
+
+    def warm_up(self, templates=None):
+        """Parse every template (or the given (category, template) pairs) up front so the first request is as fast as the rest."""
+        cache = {'xml': zip_cache, 'stream': layout_cache}.get(self.engine, workbook_cache)
+        for category_name, category in self.config['files'].items():
+            for template_name, template_details in category.items():
+                if templates is not None and (category_name, template_name) not in templates:
+                    continue
+                try:
+                    cache.get(template_details['path'])
+                except Exception as e:
+                    print(f"Warning: Could not load template {template_details['path']}: {e}")
+
+    def watch(self, interval: float = DEFAULT_INTERVAL):
+        """Reload the config and re-parse changed templates until stop_event is set."""
+        while not self.stop_event.wait(interval):
+            changes = self.watcher.check()
+            # Requests already running keep the config they started with
+            self.config = self.watcher.config
+            if changes.templates:
+                print(f"Reloaded {len(changes.templates)} changed template(s)")
+                self.warm_up(set(changes.templates))
+
+    def generate(self, request: Dict) -> Dict:
+        """Run one generation request on the pool and wait for its result."""
+        if not self.slots.acquire(blocking=False):
+            raise OverflowError("Too many generation requests in progress.")
+        try:
+            return self.pool.submit(self._generate, request).result()
+        finally:
+            self.slots.release()
+
+    def _generate(self, request: Dict) -> Dict:
+        # Concurrent requests are safe: each batch reserves its serial numbers atomically and holds its
+        # journal while it runs, so even identical requests get separate blocks
+        metrics = GenerationMetrics()
+        if request.get('templates'):
+            files = process_fanout_generation(
+                self.config,
+                self.config_path,
+                request['category'],
+                request['templates'],
+                request['inputs'],
+                int(request.get('quantity', 1)),
+                request['output_dir'],
+                engine=request.get('engine', self.engine),
+                workers=self._request_workers(request),
+                metrics=metrics,
+                tables=request.get('tables'),
+                profile=request.get('profile', 'default'),
+                layout=request.get('layout', 'flat'),
+                verify=bool(request.get('verify'))
+            )
+            return {'files': files, 'summary': metrics.finish()}
+        files = process_template_generation(
+            self.config,
+            self.config_path,
+            request['category'],
+            request['template'],
+            request['inputs'],
+            int(request.get('quantity', 1)),
+            request['output_dir'],
+            engine=request.get('engine', self.engine),
+            workers=self._request_workers(request),
+            output_mode=request.get('output_mode', 'files'),
+            bundle_compresslevel=int(request.get('compresslevel', 6)),
+            metrics=metrics,
+            tables=request.get('tables'),
+            profile=request.get('profile', 'default'),
+            layout=request.get('layout', 'flat'),
+            verify=bool(request.get('verify'))
+        )
+        return {'files': files, 'summary': metrics.finish()}
+
+    def _request_workers(self, request: Dict) -> int:
+        """Render processes for one request, never more than the service's own pool size."""
+        return max(1, min(int(request.get('workers', 1)), self.workers))
+
+    def templates(self) -> Dict:
+        return {name: list(category) for name, category in self.config['files'].items()}
+
+class _Handler(BaseHTTPRequestHandler):
+    service: GenerationService = None
+
+    def _reply(self, status: int, body: Dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _is_local(self) -> bool:
+        """Whether the request was addressed to localhost; a rebound DNS name is turned away."""
+        host = self.headers.get('Host', '')
+        if host.startswith('['):
+            host = host[:host.find(']') + 1]
+        else:
+            host = host.split(':')[0]
+        return host in LOCAL_HOSTS
+
+    def do_GET(self):
+        if not self._is_local():
+            self._reply(403, {'error': "Only requests to localhost are served"})
+            return
+        if self.path == '/health':
+            count = sum(len(templates) for templates in self.service.templates().values())
+            self._reply(200, {'status': 'ok', 'templates': count})
+        elif self.path == '/templates':
+            self._reply(200, self.service.templates())
+        else:
+            self._reply(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/generate':
+            self._reply(404, {'error': f"Unknown path {self.path}"})
+            return
+        if not self._is_local():
+            self._reply(403, {'error': "Only requests to localhost are served"})
+            return
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            # A page in a browser can post text/plain to localhost without asking first; JSON it cannot
+            self._reply(415, {'error': "Content-Type must be application/json"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            self._reply(200, self.service.generate(request))
+        except VerificationError as e:
+            self._reply(422, {'error': str(e), 'files': e.files, 'verification': e.report.summary()})
+        except OverflowError as e:
+            self._reply(503, {'error': str(e)})
+        except (KeyError, ValueError, TypeError) as e:
+            self._reply(400, {'error': f"Bad request: {e}"})
+        except Exception as e:
+            self._reply(500, {'error': str(e)})
+
+    def log_message(self, format, *args):
+        # Keep the console quiet; errors are returned to the client
+        pass
+
+def serve(config_path: str, port: int = DEFAULT_PORT, workers: int = 4, engine: str = 'xml',
+          watch_interval: float = DEFAULT_INTERVAL):
+    """Run the service until interrupted; a watch_interval of 0 turns off reloading."""
+    service = GenerationService(config_path, workers, engine)
+    service.warm_up()
+    if watch_interval > 0:
+        threading.Thread(target=service.watch, args=(watch_interval,), daemon=True).start()
+    handler = type('Handler', (_Handler,), {'service': service})
+    server = ThreadingHTTPServer((HOST, port), handler)
+    print(f"Generation service listening on http://{HOST}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop_event.set()
+        service.pool.shutdown()
+
+def submit_generation(url: str, request: Dict, timeout: float = None) -> Dict:
+    """Send a generation request to a running service and return its response."""
+    # Imported here because urllib.request is slow to import and only clients need it
+    import urllib.error
+    import urllib.request
+
+    data = json.dumps(request).encode('utf-8')
+    http_request = urllib.request.Request(
+        url.rstrip('/') + '/generate', data=data, headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        body = json.loads(e.read())
+        if 'verification' in body:
+            raise VerificationError(VerificationReport.from_summary(body['verification']), body['files']) from None
+        raise RuntimeError(body.get('error', str(e))) from None
@@ -3,16 +3,62 @@ File name: template_editor.py
 Template Editor - A tool for editing templates from Excel files
 """
 
-from calendar import c
+import csv
+import io
 import json
-import sys  # Added missing import
-from openpyxl import load_workbook
-from typing import Dict, Tuple, Any
+import re
+import sys
+from typing import Callable, Dict, Tuple, Any, Iterator
 import os
-import shutil
-from datetime import datetime
+import threading
+import zipfile
+from collections import OrderedDict
+from datetime import datetime, timezone
 from pathlib import Path
 
+from catalogue import TemplateCatalogue
+from document_index import get_document_index
+from job_journal import GenerationJob, find_job, jobs_dir
+from label_index import LabelIndex, file_sha256, get_label_index
+from manifest import MANIFEST_FILENAME, append_records, manifest_record, read_records, tables_record
+from serial_ledger import get_ledger
+from verifier import VerificationError, VerificationReport, check_file, serial_gaps
+from template_spec import TemplateSpec, parse_results
+from metrics import GenerationMetrics, measured_call
+from xlsx_writer import (WRITER_PROFILES, TemplateLayout, WriterProfile, ZipTemplate, column_letters,
+                         patch_template, stream_template, write_zip)
+
+# Writer engines accepted by save_modified_template
+ENGINES = ('openpyxl', 'xml', 'stream')
+
+# Output compression profiles accepted by save_modified_template (see xlsx_writer.py)
+PROFILES = tuple(WRITER_PROFILES)
+
+# How process_template_generation lays out its output:
+#   files    - one workbook per serial number
+#   workbook - a single workbook with one sheet per serial number
+#   zip      - one ZIP archive holding a workbook per serial number
+#   manifest - no workbooks, just a record per serial number (see manifest.py)
+OUTPUT_MODES = ('files', 'workbook', 'zip', 'manifest')
+
+# Where in the output directory the files of a batch go:
+#   flat        - straight in the output directory
+#   date        - YEAR/MONTH/ of the day the batch was started
+#   serial      - a directory per base serial number
+#   date-serial - YEAR/MONTH/base serial number/
+OUTPUT_LAYOUTS = ('flat', 'date', 'serial', 'date-serial')
+
+# Characters that cannot appear in a directory name on Windows or macOS
+_INVALID_PATH_CHARS = re.compile(r'[\\/:*?"<>|]')
+
+# Characters Excel does not allow in sheet titles
+_INVALID_TITLE_CHARS = re.compile(r'[\\/*?:\[\]]')
+
+def load_workbook(*args, **kwargs):
+    """openpyxl's load_workbook, imported on first use to keep startup fast."""
+    from openpyxl import load_workbook as openpyxl_load_workbook
+    return openpyxl_load_workbook(*args, **kwargs)
+
 def get_base_path():
     """Gets the base path of the project, supporting PyInstaller."""
     if getattr(sys, 'frozen', False):
@@ -24,7 +70,13 @@ def get_base_path():
         return os.path.dirname(os.path.abspath(__file__))
 
 def load_config(config_path: str) -> Dict:
-    """Load configuration from JSON file"""
+    """
+    Load configuration from JSON file
+
+    Each template entry gains a 'spec' (a TemplateSpec) holding its parsed
+    cell references; a malformed mapping raises ValueError here. The
+    searchable TemplateCatalogue of all entries is stored under 'catalogue'.
+    """
     if not os.path.exists(config_path):
         raise FileNotFoundError(f"Configuration file not found at {config_path}")
     
@@ -36,15 +88,28 @@ def load_config(config_path: str) -> Dict:
     main_directory = os.path.dirname(os.path.abspath(__file__))
     
     for category in config.get('files', {}).values():
-        for template_details in category.values():
+        for template_name, template_details in category.items():
             if 'path' in template_details and not os.path.isabs(template_details['path']):
                 template_details['path'] = os.path.join(main_directory, template_details['path'])
+            template_details['spec'] = TemplateSpec(
+                template_name,
+                template_details.get('path', ''),
+                template_details.get('mappings', {}),
+                template_details.get('tables')
+            )
+    config['catalogue'] = TemplateCatalogue(config)
     return config
 
-def save_config(config_path: str, config_data: Dict):
-    """Save the configuration dictionary to the JSON file."""
-    with open(config_path, 'w') as f:
-        json.dump(config_data, f, indent=2)
+def iter_rows(path: str) -> Iterator[Dict[str, str]]:
+    """Yield one dict per row from a CSV or JSONL file, without reading it all in."""
+    is_jsonl = path.lower().endswith(('.jsonl', '.ndjson'))
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if is_jsonl:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
 
 def get_cell_value(workbook: Any, cell_ref: str) -> str:
     """Get value from a cell reference in the workbook"""
@@ -61,20 +126,24 @@ def get_cell_value(workbook: Any, cell_ref: str) -> str:
         print(f"Error reading cell {cell_ref}: {str(e)}")
         return ""
 
-def create_template(excel_path: str, config: Dict[str, str]) -> Dict[str, Any]:
+def create_template(excel_path: str, config: Dict[str, str], label_index: LabelIndex = None) -> Dict[str, Any]:
     """
     Create template from Excel file using configuration
     
     Args:
         excel_path: Path to the Excel file
         config: Dictionary mapping cell references to their values
+        label_index: Label index to read the question text through; defaults
+            to the one next to the default config.json, so the workbook is
+            only parsed when it changed
     
     Returns:
         Dictionary containing the template data, mapping coordinates to user responses
     """
     try:
-        # Load workbook
-        workbook = load_workbook(excel_path, data_only=True)
+        # Look up the question text for every key cell
+        label_index = label_index or get_label_index(os.path.join(get_base_path(), 'config.json'))
+        labels = label_index.labels_for(excel_path, config)
         
         # Initialize results dictionary
         results: Dict[str, str] = {}
@@ -82,7 +151,7 @@ def create_template(excel_path: str, config: Dict[str, str]) -> Dict[str, Any]:
         # Process each mapping
         for key, value in config.items():
             # Get the question text from the key cell
-            question = get_cell_value(workbook, key)
+            question = labels[key]
             # Get the coordinate that will be used as the key
             coordinate = value
             
@@ -119,33 +188,441 @@ def get_template_selection(config: Dict) -> Tuple[str, str]:
         except ValueError:
             print("Please enter a number.")
 
-def save_modified_template(template_path: str, results: Dict[str, str], output_path: str) -> str:
+class TemplateCache:
+    """
+    Small LRU cache of parsed templates.
+
+    Entries are keyed by path and are only reused while the file's mtime and
+    size are unchanged, so replacing a template on disk is picked up on the
+    next lookup.
+    """
+
+    def __init__(self, loader, maxsize: int = 8):
+        self._loader = loader
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Any:
+        """Return the parsed template at path, loading it on a miss."""
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(path)
+                return entry[1]
+
+        # Parse outside the lock so other templates can still be served
+        value = self._loader(path)
+        with self._lock:
+            self._entries[path] = (stamp, value)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, path: str = None):
+        """Drop one template from the cache, or all of them if no path is given."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+class _CachedWorkbook:
+    """A parsed template workbook plus the lock guarding its stamping."""
+
+    def __init__(self, path: str):
+        self.workbook = load_workbook(path)
+        # Sheets by position, to match the sheet index of a CellRef
+        self.sheets = [self.workbook[name] for name in self.workbook.sheetnames]
+        self.lock = threading.Lock()
+
+workbook_cache = TemplateCache(_CachedWorkbook)
+zip_cache = TemplateCache(ZipTemplate)
+# Only the workbook structure, for the 'stream' engine
+layout_cache = TemplateCache(TemplateLayout)
+# Template content hashes, recorded in manifests
+hash_cache = TemplateCache(file_sha256)
+
+def invalidate_template(path: str = None):
+    """Drop a template from every parsed-template cache, or all templates if no path is given."""
+    for cache in (workbook_cache, zip_cache, layout_cache, hash_cache):
+        cache.invalidate(path)
+
+def _save_workbook(wb: Any, output: Any, profile: WriterProfile) -> None:
+    """Save an openpyxl workbook compressed as the profile says; openpyxl writes every member itself, so nothing is reused."""
+    if profile == WRITER_PROFILES['default']:
+        wb.save(output)
+        return
+    from openpyxl.writer.excel import ExcelWriter
+
+    # What Workbook.save does, with our own archive
+    wb.properties.modified = datetime.now(timezone.utc).replace(tzinfo=None)
+    archive = zipfile.ZipFile(output, 'w', profile.compression, compresslevel=profile.compresslevel, allowZip64=True)
+    ExcelWriter(wb, archive).save()
+
+def render_template(
+    template_path: str,
+    results: Any,
+    output: Any,
+    engine: str = 'openpyxl',
+    profile: str = 'default',
+    metrics: GenerationMetrics = None
+) -> None:
+    """
+    Write a copy of the template with the given results to a path or binary file object.
+
+    With the 'openpyxl' engine the template is parsed once and kept in
+    `workbook_cache`; each copy is stamped out by writing the results into the
+    cached workbook, saving it and restoring the original cell values. The
+    'xml' engine instead patches only the affected worksheet XML and copies
+    every other part of the template unchanged. The 'stream' engine does the
+    same but reads the template from disk a chunk at a time for every copy,
+    so its memory use does not grow with the template; use it for very large
+    templates (its 'save' stage includes writing the cells).
+
+    results is either a coordinate -> value dict or the (CellRef, value)
+    pairs built by TemplateSpec.cells_for; the latter need no parsing.
+
+    profile names the WRITER_PROFILES entry (xlsx_writer.py) that sets how
+    the output is compressed: 'default', 'stored', 'fast' or 'archive'.
+
+    Stage timings are recorded in metrics, if given.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown writer engine: {engine}")
+    if profile not in WRITER_PROFILES:
+        raise ValueError(f"Unknown writer profile: {profile}")
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"Template file not found: {template_path}")
+    metrics = metrics or GenerationMetrics()
+    writer_profile = WRITER_PROFILES[profile]
+
+    if engine == 'xml':
+        with metrics.stage('load_template'):
+            template = zip_cache.get(template_path)
+        with metrics.stage('write_cells'):
+            if isinstance(results, dict):
+                results = parse_results(results, template.sheet_names)
+            patched = patch_template(template, results)
+        with metrics.stage('save'):
+            write_zip(template, patched, output, writer_profile)
+        return
+
+    if engine == 'stream':
+        with metrics.stage('load_template'):
+            layout = layout_cache.get(template_path)
+        if isinstance(results, dict):
+            results = parse_results(results, layout.sheet_names)
+        with metrics.stage('save'):
+            stream_template(layout, results, output, writer_profile)
+        return
+
+    with metrics.stage('load_template'):
+        cached = workbook_cache.get(template_path)
+    with cached.lock:
+        wb = cached.workbook
+        originals = []
+        try:
+            with metrics.stage('write_cells'):
+                if isinstance(results, dict):
+                    results = parse_results(results, wb.sheetnames)
+                for (sheet, row, column), value in results:
+                    try:
+                        target = (wb.active if sheet is None else cached.sheets[sheet]).cell(row=row, column=column)
+                        original = target.value
+                        target.value = value
+                    except Exception as e:
+                        # e.g. a merged cell, which openpyxl will not write to
+                        print(f"Warning: Could not write to cell {column_letters(column)}{row}: {e}")
+                        continue
+                    originals.append((target, original))
+
+            with metrics.stage('save'):
+                _save_workbook(wb, output, writer_profile)
+        finally:
+            # Put the template back the way it was for the next copy
+            for target, value in reversed(originals):
+                target.value = value
+
+def render_template_bytes(
+    template_path: str,
+    results: Any,
+    engine: str = 'openpyxl',
+    profile: str = 'default',
+    metrics: GenerationMetrics = None
+) -> bytes:
+    """Render a filled-in copy of the template into memory."""
+    metrics = metrics or GenerationMetrics()
+    buffer = io.BytesIO()
+    render_template(template_path, results, buffer, engine, profile, metrics)
+    data = buffer.getvalue()
+    metrics.add_output(len(data))
+    return data
+
+def save_modified_template(
+    template_path: str,
+    results: Any,
+    output_path: str,
+    engine: str = 'openpyxl',
+    profile: str = 'default',
+    metrics: GenerationMetrics = None
+) -> str:
     """
     Creates and saves a modified copy of the template with the given results.
+
+    See render_template for how the engines and writer profiles differ.
     """
     if not os.path.exists(template_path):
         raise FileNotFoundError(f"Template file not found: {template_path}")
+    metrics = metrics or GenerationMetrics()
 
     # Ensure the output directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    os.makedirs(os.path.dirname(output_path) or os.curdir, exist_ok=True)
 
-    # Copy the template to the new path
-    shutil.copy2(template_path, output_path)
+    render_template(template_path, results, output_path, engine, profile, metrics)
+    metrics.add_output(os.path.getsize(output_path))
+    return output_path
 
-    # Load the new workbook and update cells
-    wb = load_workbook(output_path)
-    for coordinate, value in results.items():
-        if not value:
-            continue
+def save_multi_record_workbook(
+    template_path: str,
+    results_per_record: list,
+    serial_numbers: list,
+    output_path: str,
+    progress: Callable = None,
+    cancel_event: threading.Event = None,
+    metrics: GenerationMetrics = None,
+    profile: str = 'default'
+) -> int:
+    """
+    Save every record as its own sheet, copied from the template sheet, in one workbook.
+
+    Each record is a coordinate -> value dict or a list of (CellRef, value)
+    pairs. All mapped cells must live on the same sheet. An 'Index' sheet listing
+    the serial numbers (linked to their sheets) is placed first. Returns the
+    number of records written, which is less than requested if cancelled.
+    """
+    from openpyxl.worksheet.hyperlink import Hyperlink
+
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"Template file not found: {template_path}")
+    os.makedirs(os.path.dirname(output_path) or os.curdir, exist_ok=True)
+    metrics = metrics or GenerationMetrics()
+
+    # Sheets are added and removed, so work on a private copy rather than the cache
+    with metrics.stage('load_template'):
+        wb = load_workbook(template_path)
+    results_per_record = [parse_results(results, wb.sheetnames) if isinstance(results, dict) else results
+                          for results in results_per_record]
+    sheet_indices = {ref.sheet for results in results_per_record for ref, _ in results}
+    if len(sheet_indices) > 1:
+        raise ValueError("Multi-record workbooks need every mapping on the same sheet.")
+    sheet_index = sheet_indices.pop() if sheet_indices else None
+    template_sheet = wb.active if sheet_index is None else wb[wb.sheetnames[sheet_index]]
+
+    index_sheet = wb.create_sheet('Index', 0)
+    index_sheet.append(["Serial Number", "Sheet"])
+
+    written = 0
+    for results, serial_number in zip(results_per_record, serial_numbers):
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        with metrics.stage('copy_sheet'):
+            sheet = wb.copy_worksheet(template_sheet)
+            sheet.title = _INVALID_TITLE_CHARS.sub('_', serial_number)[:31]
+            sheet.print_area = template_sheet.print_area
+        with metrics.stage('write_cells'):
+            for ref, value in results:
+                sheet.cell(row=ref.row, column=ref.column).value = value
+
+        index_sheet.append([serial_number, sheet.title])
+        link = index_sheet.cell(row=index_sheet.max_row, column=2)
+        link.hyperlink = Hyperlink(ref=link.coordinate, location=f"'{sheet.title}'!A1")
+        written += 1
+        if progress:
+            progress(written, len(serial_numbers), output_path)
+
+    wb.remove(template_sheet)
+    wb.active = 0
+    with metrics.stage('save'):
+        _save_workbook(wb, output_path, WRITER_PROFILES[profile])
+    metrics.add_output(os.path.getsize(output_path))
+    return written
+
+def _render_batch(
+    task: Callable,
+    task_args: list,
+    labels: list,
+    workers: int,
+    progress: Callable = None,
+    cancel_event: threading.Event = None,
+    on_result: Callable = None,
+    metrics: GenerationMetrics = None
+) -> Tuple[list, int]:
+    """
+    Run task(*args) for every file of a batch, optionally in a process pool.
+
+    on_result(index, result) is called in this process as each file finishes,
+    and progress(done, total, label) after it. Returns the indices of the
+    finished files in serial order and how many serial numbers were consumed
+    (the position of the last file finished). In a process pool files finish
+    out of order, so after a cancel some before that position may be
+    missing; callers keep such a batch's journal so they can be filled in.
+    Stops early once cancel_event is set; files already being rendered are
+    allowed to finish.
+
+    task must accept a metrics keyword; timings taken in worker processes are
+    sent back and merged into metrics.
+    """
+    metrics = metrics or GenerationMetrics()
+    total = len(task_args)
+    finished = []
+
+    def handle(index, result):
+        if on_result:
+            on_result(index, result)
+        finished.append(index)
+        if progress:
+            progress(len(finished), total, labels[index])
+
+    if workers <= 1 or total <= 1:
+        for index, args in enumerate(task_args):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            handle(index, task(*args, metrics=metrics))
+        return finished, len(finished)
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    def collect(future):
+        result, worker_metrics = future.result()
+        metrics.merge(worker_metrics)
+        return result
+
+    # Each worker process keeps its own template cache
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(measured_call, task, args): index for index, args in enumerate(task_args)}
         try:
-            sheet_name, cell = (coordinate.split('!') if '!' in coordinate else (None, coordinate))
-            sheet = wb[sheet_name] if sheet_name else wb.active
-            sheet[cell] = value
-        except Exception as e:
-            print(f"Warning: Could not write to cell {coordinate}: {e}")
-    
-    wb.save(output_path)
-    return output_path
+            for future in as_completed(futures):
+                handle(futures[future], collect(future))
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+        finally:
+            for pending in futures:
+                pending.cancel()
+
+    # Pick up files that were already running when the batch was cancelled
+    handled = set(finished)
+    for future, index in futures.items():
+        if index not in handled and future.done() and not future.cancelled():
+            handle(index, collect(future))
+
+    finished.sort()
+    return finished, (finished[-1] + 1 if finished else 0)
+
+def _document_filename(template_name: str, serial_number: str) -> str:
+    """Name of the file holding one document, e.g. Template_100-5.xlsx."""
+    return f"{template_name.replace(' ', '_')}_{serial_number}.xlsx"
+
+def _batch_filename(template_name: str, serial_numbers: list, extension: str) -> str:
+    """Name for a single file holding a whole batch, e.g. Template_100-1_to_100-5.zip."""
+    return f"{template_name.replace(' ', '_')}_{serial_numbers[0]}_to_{serial_numbers[-1]}{extension}"
+
+def _shard_subdir(layout: str, base_serial: str, when: datetime) -> str:
+    """Subdirectory of the output directory that a batch's files go to under an output layout."""
+    parts = []
+    if layout in ('date', 'date-serial'):
+        parts += [f"{when:%Y}", f"{when:%m}"]
+    if layout in ('serial', 'date-serial'):
+        parts.append(_INVALID_PATH_CHARS.sub('_', base_serial).strip(' .') or '_')
+    return os.path.join(*parts) if parts else ''
+
+def _document_location(template_name: str, serial_number: str, path: str) -> Tuple[str, str]:
+    """(zip member, sheet title) of a document within the file at path; None for whichever does not apply."""
+    filename = _document_filename(template_name, serial_number)
+    if path.endswith('.zip'):
+        return filename, None
+    if os.path.basename(path) == filename:
+        return None, None
+    # One sheet of a 'workbook' bundle
+    return None, _INVALID_TITLE_CHARS.sub('_', serial_number)[:31]
+
+def _verify_batch(documents: list, workers: int, progress: Callable = None, cancel_event: threading.Event = None,
+                  metrics: GenerationMetrics = None) -> VerificationReport:
+    """Read back (serial number, path, template, cells) documents, a file per task, and report on them."""
+    by_file: Dict[str, list] = OrderedDict()
+    for serial_number, path, template_name, cells in documents:
+        member, sheet_title = _document_location(template_name, serial_number, path)
+        by_file.setdefault(path, []).append((serial_number, member, sheet_title, cells))
+    paths = list(by_file)
+    report = VerificationReport()
+
+    def collect(index, results):
+        for label, problems in results:
+            report.add(label, problems)
+
+    _render_batch(check_file, [(path, by_file[path]) for path in paths], paths, workers, progress, cancel_event,
+                  on_result=collect, metrics=metrics)
+    return report
+
+def _index_documents(config_path: str, category_name: str, spec: TemplateSpec, user_inputs: Dict[str, str],
+                     tables: Dict[str, list], base_serial: str, documents: list) -> None:
+    """Record (serial number, path) documents of a batch in the document index."""
+    if not documents:
+        return
+    template_hash = hash_cache.get(spec.path)
+    created = datetime.now().isoformat(timespec='seconds')
+    entries = []
+    for serial_number, path in documents:
+        entry = manifest_record(category_name, spec.name, template_hash, serial_number,
+                                {**user_inputs, spec.serial_key: serial_number}, os.path.basename(path))
+        entry.update(base_serial=base_serial, path=path, created=created, tables=tables)
+        entries.append(entry)
+    get_document_index(config_path).record(entries)
+
+def _job_request(category_name: str, template_name: str, user_inputs: Dict[str, str], quantity: int,
+                 output_dir: str, output_mode: str, tables: Dict[str, list] = None, layout: str = 'flat',
+                 fanout: list = None) -> Dict:
+    """
+    The request a batch's journal is found by; see job_journal.py.
+
+    fanout lists the templates of a fan-out the batch is part of, so its
+    journal is never mistaken for that of a single-template run.
+    """
+    request = {
+        'category': category_name,
+        'template': template_name,
+        'inputs': user_inputs,
+        'quantity': quantity,
+        'output_dir': os.path.abspath(output_dir),
+        'output_mode': output_mode,
+    }
+    if tables:
+        request['tables'] = tables
+    if layout != 'flat':
+        request['layout'] = layout
+    if fanout:
+        request['fanout'] = list(fanout)
+    return request
+
+def _batch_files(spec: TemplateSpec, shared_cells: list, job: GenerationJob, output_dir: str) -> Tuple[list, list, list]:
+    """Cells, serial number and output path of every file of a journaled batch, in serial order."""
+    results_per_file = []
+    serial_numbers = []
+    output_paths = []
+    # Fixed when the batch starts, so a resumed batch writes to the same place
+    output_dir = os.path.join(output_dir, job.options.get('output_subdir', ''))
+    for new_count in range(job.first_count, job.last_count + 1):
+        # Update the serial number for this specific template
+        unique_serial_number = f"{job.base_serial}-{new_count}"
+        results_per_file.append(shared_cells + [(spec.serial_cell, unique_serial_number)])
+        serial_numbers.append(unique_serial_number)
+
+        # Define the output filename
+        output_paths.append(os.path.join(output_dir, _document_filename(spec.name, unique_serial_number)))
+    return results_per_file, serial_numbers, output_paths
 
 def process_template_generation(
     config: Dict,
@@ -154,49 +631,649 @@ def process_template_generation(
     template_name: str,
     user_inputs: Dict[str, str],
     quantity: int,
-    output_dir: str
+    output_dir: str,
+    engine: str = 'openpyxl',
+    workers: int = 1,
+    progress: Callable = None,
+    cancel_event: threading.Event = None,
+    output_mode: str = 'files',
+    bundle_compresslevel: int = 6,
+    metrics: GenerationMetrics = None,
+    tables: Dict[str, list] = None,
+    profile: str = 'default',
+    layout: str = 'flat',
+    verify: bool = False,
+    job: GenerationJob = None
 ) -> list[str]:
     """
     Orchestrates the generation of templates, including serial number handling.
+
+    engine selects the writer used by save_modified_template (one of ENGINES:
+    'openpyxl', 'xml' or 'stream').
+    The batch's serial numbers are reserved as one block up front (see
+    SerialLedger.reserve), so concurrent batches, even in other processes,
+    never share one. With workers > 1 the files are rendered in a process
+    pool and the returned list stays in serial order.
+
+    progress, if given, is called as progress(done, total, output_path) after
+    each file. Setting cancel_event stops the batch early; the returned list
+    then only holds the files actually written, and the unused serial numbers
+    are handed back unless another batch has reserved past them. With
+    workers > 1 files finish out of order, so a cancel can leave some missing
+    before the last one written; the batch is then left journaled as if
+    interrupted, and generating again (or `cli.py resume`) fills them in with
+    the serial numbers they were given.
+
+    output_mode 'workbook' writes all serial numbers as sheets of a single
+    workbook (see save_multi_record_workbook) and returns just that file.
+    output_mode 'zip' streams every rendered workbook from memory straight
+    into one ZIP archive, compressed at bundle_compresslevel (0 stores the
+    members uncompressed), and returns the archive.
+    output_mode 'manifest' renders nothing: it appends one record per serial
+    number to manifest.jsonl in output_dir and returns that file; see
+    render_manifest.
+
+    metrics, if given, collects per-stage timings, bytes written and file
+    counts for the batch; call metrics.finish() to log the summary.
+
+    tables maps the names of the template's tables (see template_spec.py) to
+    their rows, each a dict of column name -> value; every document of the
+    batch gets the same rows.
+
+    profile sets how each workbook is compressed; see render_template.
+
+    layout (see OUTPUT_LAYOUTS) spreads the files over subdirectories of
+    output_dir by date and/or base serial number. In 'manifest' mode it is
+    chosen when the records are rendered instead. Every document written is
+    recorded in the document index (see document_index.py).
+
+    With verify, the documents are read back once written (see verifier.py)
+    and VerificationError is raised with the report and the files if any cell
+    does not hold its intended value or a serial number has no document. The
+    batch is complete by then: its documents stay and its serial numbers are
+    used. A cancelled batch is not verified.
+
+    Every batch is journaled (see job_journal.py). If a batch dies part way,
+    calling this again with the same request, or resume_job, reuses its
+    serial numbers and only writes the files that are missing. A batch of
+    the same request that is still running is left alone; this call then
+    gets serial numbers of its own. job is a journal to finish, as passed by
+    resume_job.
     """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown writer engine: {engine}")
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {output_mode}")
+    if profile not in WRITER_PROFILES:
+        raise ValueError(f"Unknown writer profile: {profile}")
+    if layout not in OUTPUT_LAYOUTS:
+        raise ValueError(f"Unknown output layout: {layout}")
+    metrics = metrics or GenerationMetrics()
+
     template_config = config['files'][category_name][template_name]
     template_path = template_config['path']
-    
+    spec = template_config['spec']
+
     # The last mapping is assumed to be the serial number
-    serial_number_key = list(template_config['mappings'].values())[-1]
+    serial_number_key = spec.serial_key
     base_serial_number = user_inputs.get(serial_number_key)
 
     if not base_serial_number:
         raise ValueError("Serial number is missing from user inputs.")
 
+    # Parsed once here; the writers only see (CellRef, value) pairs
+    shared_cells = spec.cells_for(user_inputs)
+    for table_name, rows in (tables or {}).items():
+        shared_cells += spec.table_cells(table_name, rows)
+
+    # Serial counters live in the ledger next to config.json
+    ledger = get_ledger(config_path, config)
+
+    directory = jobs_dir(config_path)
+    if job is None:
+        request = _job_request(category_name, template_name, user_inputs, quantity, output_dir, output_mode, tables,
+                               layout)
+        job = find_job(directory, request)
+    else:
+        request = job.request
+    if job is not None:
+        # Resume an interrupted batch with the serial numbers it was given
+        job.reconcile()
+        try:
+            with metrics.stage('reserve_serials'):
+                ledger.advance(base_serial_number, job.last_count)
+        except BaseException:
+            # Let go of the journal so it can still be resumed
+            job.close()
+            raise
+    else:
+        # Claim the whole block at once, so other processes never get the same numbers
+        with metrics.stage('reserve_serials'):
+            first_count, _ = ledger.reserve(base_serial_number, quantity)
+        options = {'engine': engine, 'bundle_compresslevel': bundle_compresslevel, 'profile': profile}
+        if output_mode != 'manifest':
+            options['output_subdir'] = _shard_subdir(layout, base_serial_number, datetime.now())
+        job = GenerationJob.create(directory, request, options, base_serial_number, first_count)
+    results_per_file, serial_numbers, output_paths = _batch_files(spec, shared_cells, job, output_dir)
+    batch_dir = os.path.join(output_dir, job.options.get('output_subdir', ''))
+
+    try:
+        if output_mode == 'workbook':
+            output_path = os.path.join(batch_dir, _batch_filename(template_name, serial_numbers, '.xlsx'))
+            used = save_multi_record_workbook(
+                template_path, results_per_file, serial_numbers, output_path, progress, cancel_event, metrics,
+                profile
+            )
+            generated_files = [output_path]
+            documents = [(serial_number, output_path) for serial_number in serial_numbers[:used]]
+        elif output_mode == 'manifest':
+            manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+            with metrics.stage('manifest_write'):
+                template_hash = hash_cache.get(template_path)
+                # Tables are written once and referred to by every document of the batch
+                shared = [tables_record(tables)] if tables else []
+                tables_hash = shared[0]['tables_sha256'] if shared else None
+                records = shared + [
+                    manifest_record(category_name, template_name, template_hash, serial_number,
+                                    {**user_inputs, serial_number_key: serial_number}, os.path.basename(path),
+                                    tables_hash)
+                    for serial_number, path in zip(serial_numbers, output_paths)
+                ]
+                metrics.add_output(append_records(manifest_path, records))
+            used = quantity
+            if progress:
+                progress(quantity, quantity, manifest_path)
+            generated_files = [manifest_path]
+            # Indexed once rendered
+            documents = []
+        elif output_mode == 'zip':
+            archive_path = os.path.join(batch_dir, _batch_filename(template_name, serial_numbers, '.zip'))
+            member_names = [os.path.basename(path) for path in output_paths]
+            os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+            compression = zipfile.ZIP_DEFLATED if bundle_compresslevel else zipfile.ZIP_STORED
+            def add_to_bundle(index, data):
+                with metrics.stage('bundle_write'):
+                    archive.writestr(member_names[index], data)
+
+            with zipfile.ZipFile(archive_path, 'w', compression, compresslevel=bundle_compresslevel or None) as archive:
+                finished, used = _render_batch(
+                    render_template_bytes,
+                    [(template_path, results, engine, profile) for results in results_per_file],
+                    member_names,
+                    workers,
+                    progress,
+                    cancel_event,
+                    on_result=add_to_bundle,
+                    metrics=metrics
+                )
+            generated_files = [archive_path]
+            documents = [(serial_numbers[index], archive_path) for index in finished]
+        else:
+            # Only the files the journal does not already account for are rendered
+            pending = [index for index in range(quantity) if index not in job.completed]
+            def record_file(position, _):
+                index = pending[position]
+                with metrics.stage('journal'):
+                    job.record(index, serial_numbers[index], output_paths[index])
+
+            _render_batch(
+                save_modified_template,
+                [(template_path, results_per_file[index], output_paths[index], engine, profile) for index in pending],
+                [output_paths[index] for index in pending],
+                workers,
+                progress,
+                cancel_event,
+                on_result=record_file,
+                metrics=metrics
+            )
+            finished = sorted(job.completed)
+            generated_files = [output_paths[index] for index in finished]
+            documents = [(serial_numbers[index], output_paths[index]) for index in finished]
+            used = finished[-1] + 1 if finished else 0
+
+        with metrics.stage('index'):
+            _index_documents(config_path, category_name, spec, user_inputs, tables, base_serial_number, documents)
+    except BaseException:
+        # The journal stays behind so the batch can be resumed
+        job.close()
+        raise
+
+    if output_mode != 'manifest' and len(documents) < used:
+        # Cancelled with gaps before the last file written: keep the journal so the gaps can be filled
+        job.close()
+        return generated_files
+
+    # A cancelled batch hands back the serial numbers it did not use, while no one has reserved past them
+    if used < quantity:
+        with metrics.stage('record_serials'):
+            ledger.release(base_serial_number, job.first_count, job.last_count, used)
+    job.remove()
+
+    if verify and documents and not (cancel_event is not None and cancel_event.is_set()):
+        cells_by_serial = dict(zip(serial_numbers, results_per_file))
+        report = _verify_batch(
+            [(serial_number, path, template_name, cells_by_serial[serial_number]) for serial_number, path in documents],
+            workers, metrics=metrics
+        )
+        report.gaps = serial_gaps(serial_number for serial_number, _ in documents)
+        if not report.passed:
+            raise VerificationError(report, generated_files)
+
+    return generated_files
+
+def process_fanout_generation(
+    config: Dict,
+    config_path: str,
+    category_name: str,
+    template_names: list,
+    user_inputs: Dict[str, str],
+    quantity: int,
+    output_dir: str,
+    engine: str = 'openpyxl',
+    workers: int = 1,
+    progress: Callable = None,
+    cancel_event: threading.Event = None,
+    metrics: GenerationMetrics = None,
+    tables: Dict[str, list] = None,
+    profile: str = 'default',
+    layout: str = 'flat',
+    verify: bool = False
+) -> list[str]:
+    """
+    Generate one set of answers into several templates of a category at once.
+
+    The templates' mappings share their answer cells: every input must be
+    an answer cell of at least one template, and each template is filled
+    with the inputs for its own answer cells (and the tables it has). Every
+    template gets quantity files, written as in 'files' output mode.
+
+    All serial numbers are reserved in a single ledger write, in template
+    order (see SerialLedger.reserve_blocks), and the files of every
+    template are rendered in one batch, so a process pool is started once
+    and each worker parses each template once. progress is called with the
+    running total over all templates. layout, verify and the document index
+    work as in process_template_generation.
+
+    Each template's part has a journal of its own, keyed by the whole
+    fan-out so a single-template run never takes it up, and `cli.py resume`
+    finishes any of them. Calling this again with the same arguments
+    finishes each part left unfinished from its journal and generates the
+    other parts afresh. Returns the files written, template by template.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown writer engine: {engine}")
+    if profile not in WRITER_PROFILES:
+        raise ValueError(f"Unknown writer profile: {profile}")
+    if layout not in OUTPUT_LAYOUTS:
+        raise ValueError(f"Unknown output layout: {layout}")
+    if len(set(template_names)) != len(template_names):
+        raise ValueError("A template is listed more than once.")
+    metrics = metrics or GenerationMetrics()
+    category = config['files'][category_name]
+    specs = [category[template_name]['spec'] for template_name in template_names]
+
+    answer_cells = [set(spec.mappings.values()) for spec in specs]
+    unmapped = [cell for cell in user_inputs if not any(cell in cells for cells in answer_cells)]
+    if unmapped:
+        raise ValueError(f"No selected template has the answer cell(s) {', '.join(unmapped)}")
+    tables = tables or {}
+    unknown_tables = [name for name in tables if not any(name in spec.tables for spec in specs)]
+    if unknown_tables:
+        raise ValueError(f"No selected template has the table(s) {', '.join(unknown_tables)}")
+
+    parts = []
+    for spec, cells in zip(specs, answer_cells):
+        inputs = {cell: value for cell, value in user_inputs.items() if cell in cells}
+        if not inputs.get(spec.serial_key):
+            raise ValueError(f"Serial number is missing from user inputs for '{spec.name}'.")
+        template_tables = {name: rows for name, rows in tables.items() if name in spec.tables}
+        shared_cells = spec.cells_for(inputs)
+        for table_name, rows in template_tables.items():
+            shared_cells += spec.table_cells(table_name, rows)
+        request = _job_request(category_name, spec.name, inputs, quantity, output_dir, 'files', template_tables,
+                               layout, template_names)
+        parts.append((spec, inputs[spec.serial_key], shared_cells, request))
+
+    ledger = get_ledger(config_path, config)
+    directory = jobs_dir(config_path)
+    jobs = [find_job(directory, request) for _, _, _, request in parts]
+    try:
+        with metrics.stage('reserve_serials'):
+            # Parts left unfinished keep the serial numbers they were given
+            for job in jobs:
+                if job is not None:
+                    job.reconcile()
+                    ledger.advance(job.base_serial, job.last_count)
+            # The rest are claimed together
+            fresh = [number for number, job in enumerate(jobs) if job is None]
+            if fresh:
+                blocks = ledger.reserve_blocks([(parts[number][1], quantity) for number in fresh])
+                started = datetime.now()
+                for number, (first_count, _) in zip(fresh, blocks):
+                    _, base_serial, _, request = parts[number]
+                    options = {'engine': engine, 'profile': profile,
+                               'output_subdir': _shard_subdir(layout, base_serial, started)}
+                    jobs[number] = GenerationJob.create(directory, request, options, base_serial, first_count)
+    except BaseException:
+        for job in jobs:
+            if job is not None:
+                job.close()
+        raise
+
+    # One task list over every template; each entry remembers which job and file it is
+    task_args = []
+    task_files = []
+    file_cells = {}
+    serial_numbers = {}
+    output_paths = {}
+    for job_number, ((spec, _, shared_cells, _), job) in enumerate(zip(parts, jobs)):
+        file_cells[job_number], serial_numbers[job_number], output_paths[job_number] = _batch_files(
+            spec, shared_cells, job, output_dir)
+        for index in range(quantity):
+            if index not in job.completed:
+                task_args.append((spec.path, file_cells[job_number][index], output_paths[job_number][index], engine,
+                                  profile))
+                task_files.append((job_number, index))
+
+    def record_file(position, _):
+        job_number, index = task_files[position]
+        with metrics.stage('journal'):
+            jobs[job_number].record(index, serial_numbers[job_number][index], output_paths[job_number][index])
+
+    try:
+        _render_batch(
+            save_modified_template,
+            task_args,
+            [output_paths[job_number][index] for job_number, index in task_files],
+            workers,
+            progress,
+            cancel_event,
+            on_result=record_file,
+            metrics=metrics
+        )
+        with metrics.stage('index'):
+            for job_number, ((spec, base_serial, _, request), job) in enumerate(zip(parts, jobs)):
+                documents = [(serial_numbers[job_number][index], output_paths[job_number][index])
+                             for index in sorted(job.completed)]
+                _index_documents(config_path, category_name, spec, request['inputs'], request.get('tables'),
+                                 base_serial, documents)
+    except BaseException:
+        # The journals stay behind so the fan-out can be resumed
+        for job in jobs:
+            job.close()
+        raise
+
     generated_files = []
-    serial_numbers_data = config.get('serial_numbers', {})
+    for job_number, job in enumerate(jobs):
+        generated_files += [output_paths[job_number][index] for index in sorted(job.completed)]
+    # Counts reserved and counts written, per base serial number over every part; templates sharing a
+    # base serial number take consecutive blocks, so a gap can span parts
+    reserved: Dict[str, set] = {}
+    written: Dict[str, set] = {}
+    for job in jobs:
+        reserved.setdefault(job.base_serial, set()).update(range(job.first_count, job.last_count + 1))
+        written.setdefault(job.base_serial, set()).update(job.first_count + index for index in job.completed)
+    first_missing = {base_serial: min(counts - written[base_serial], default=None)
+                     for base_serial, counts in reserved.items()}
+    if any(missing is not None and any(count > missing for count in written[base_serial])
+           for base_serial, missing in first_missing.items()):
+        # Cancelled with gaps before the last file written; the journals stay so the gaps can be filled
+        for job in jobs:
+            job.close()
+        return generated_files
 
-    for i in range(quantity):
-        # Get the current count for this serial number, or start at 0
-        current_count = serial_numbers_data.get(base_serial_number, 0)
-        new_count = current_count + 1
-        
-        # Update the serial number for this specific template
-        unique_serial_number = f"{base_serial_number}-{new_count}"
-        results_for_this_file = user_inputs.copy()
-        results_for_this_file[serial_number_key] = unique_serial_number
-        
-        # Define the output filename
-        output_filename = f"{template_name.replace(' ', '_')}_{unique_serial_number}.xlsx"
-        output_path = os.path.join(output_dir, output_filename)
-        
-        # Save the individual file
-        save_modified_template(template_path, results_for_this_file, output_path)
-        generated_files.append(output_path)
-        
-        # Update the count in our dictionary for the next iteration
-        serial_numbers_data[base_serial_number] = new_count
+    # A cancelled fan-out hands back each serial number's unused counts from the first missing one, as one
+    # batch does; a resumed part's block need not adjoin the fresh ones, so only the last run of counts goes
+    with metrics.stage('record_serials'):
+        for base_serial, missing in first_missing.items():
+            if missing is None:
+                continue
+            last = max(reserved[base_serial])
+            first = last
+            while first - 1 >= missing and first - 1 in reserved[base_serial]:
+                first -= 1
+            ledger.release(base_serial, first, last, 0)
+    for job in jobs:
+        job.remove()
 
-    # After the loop, save the updated config file with the new serial counts
-    config['serial_numbers'] = serial_numbers_data
-    save_config(config_path, config)
-    
+    if verify and generated_files and not (cancel_event is not None and cancel_event.is_set()):
+        documents = [
+            (serial_numbers[job_number][index], output_paths[job_number][index], spec.name, file_cells[job_number][index])
+            for job_number, ((spec, _, _, _), job) in enumerate(zip(parts, jobs))
+            for index in sorted(job.completed)
+        ]
+        report = _verify_batch(documents, workers, metrics=metrics)
+        report.gaps = serial_gaps(document[0] for document in documents)
+        if not report.passed:
+            raise VerificationError(report, generated_files)
     return generated_files
 
-config = load_config("Main/config.json")
+def render_manifest(
+    config: Dict,
+    manifest_path: str,
+    serial_numbers: list = None,
+    output_dir: str = None,
+    engine: str = 'openpyxl',
+    workers: int = 1,
+    progress: Callable = None,
+    cancel_event: threading.Event = None,
+    allow_template_change: bool = False,
+    metrics: GenerationMetrics = None,
+    profile: str = 'default',
+    layout: str = 'flat',
+    config_path: str = None
+) -> list[str]:
+    """
+    Render manifest records to XLSX files, by default every record.
+
+    Files are written to output_dir (the manifest's directory by default),
+    arranged by layout (see OUTPUT_LAYOUTS), under the names they would have
+    had in 'files' mode. A template that has changed since the records were
+    issued raises ValueError unless allow_template_change is set. With
+    config_path, the files are recorded in that config's document index.
+    Returns the files written, in manifest order.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown writer engine: {engine}")
+    if profile not in WRITER_PROFILES:
+        raise ValueError(f"Unknown writer profile: {profile}")
+    if layout not in OUTPUT_LAYOUTS:
+        raise ValueError(f"Unknown output layout: {layout}")
+    metrics = metrics or GenerationMetrics()
+    output_dir = output_dir or os.path.dirname(os.path.abspath(manifest_path))
+
+    records = read_records(manifest_path, serial_numbers)
+    started = datetime.now()
+    output_paths = []
+    for record in records:
+        base_serial = record['serial'].rsplit('-', 1)[0]
+        output_paths.append(os.path.join(output_dir, _shard_subdir(layout, base_serial, started), record['file']))
+    finished = _render_records(config, records, output_paths, engine, profile, workers, progress, cancel_event,
+                               allow_template_change, metrics)
+
+    if config_path:
+        created = datetime.now().isoformat(timespec='seconds')
+        with metrics.stage('index'):
+            get_document_index(config_path).record(
+                {**records[index], 'base_serial': records[index]['serial'].rsplit('-', 1)[0],
+                 'path': output_paths[index], 'created': created}
+                for index in finished
+            )
+    return [output_paths[index] for index in finished]
+
+def reprint_documents(
+    config: Dict,
+    config_path: str,
+    serial_numbers: list,
+    output_dir: str = None,
+    engine: str = 'openpyxl',
+    workers: int = 1,
+    progress: Callable = None,
+    cancel_event: threading.Event = None,
+    allow_template_change: bool = False,
+    metrics: GenerationMetrics = None,
+    profile: str = 'default'
+) -> list[str]:
+    """
+    Render documents again from the values recorded in the document index.
+
+    Each file is written to output_dir, or else where the original was (next
+    to it, for a document inside a 'workbook' or 'zip' bundle). A serial
+    number that is not in the index raises ValueError, as does a template that
+    has changed since, unless allow_template_change is set. Returns the files
+    written, in the order asked for.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown writer engine: {engine}")
+    if profile not in WRITER_PROFILES:
+        raise ValueError(f"Unknown writer profile: {profile}")
+    metrics = metrics or GenerationMetrics()
+    index = get_document_index(config_path)
+
+    records = []
+    output_paths = []
+    with metrics.stage('lookup'):
+        for serial_number in serial_numbers:
+            record = index.lookup(serial_number)
+            if record is None:
+                raise ValueError(f"No document with serial number {serial_number} in the index.")
+            records.append(record)
+            filename = _document_filename(record['template'], serial_number)
+            if output_dir:
+                output_paths.append(os.path.join(output_dir, filename))
+            elif record['path'].endswith(filename):
+                output_paths.append(record['path'])
+            else:
+                # Inside a bundle; written beside it
+                output_paths.append(os.path.join(os.path.dirname(record['path']), filename))
+    finished = _render_records(config, records, output_paths, engine, profile, workers, progress, cancel_event,
+                               allow_template_change, metrics)
+    return [output_paths[position] for position in finished]
+
+def verify_documents(
+    config: Dict,
+    config_path: str,
+    serial_numbers: list = None,
+    base_serial: str = None,
+    template: str = None,
+    workers: int = 1,
+    progress: Callable = None,
+    cancel_event: threading.Event = None,
+    metrics: GenerationMetrics = None
+) -> VerificationReport:
+    """
+    Read generated documents back and check them against the document index.
+
+    Checks the documents with the given serial numbers, or else every indexed
+    document of base_serial and/or template (all of them if neither is
+    given): each filled cell must hold the value recorded for it. The report
+    also lists serial numbers of the base serial numbers checked that have no
+    document, such as ones issued to a manifest but never rendered. A serial
+    number that is not in the index raises ValueError.
+    """
+    metrics = metrics or GenerationMetrics()
+    index = get_document_index(config_path)
+    with metrics.stage('lookup'):
+        if serial_numbers:
+            records = []
+            for serial_number in serial_numbers:
+                record = index.lookup(serial_number)
+                if record is None:
+                    raise ValueError(f"No document with serial number {serial_number} in the index.")
+                records.append(record)
+        else:
+            records = index.find(base_serial=base_serial, template=template)
+
+    report = VerificationReport()
+    documents = []
+    for record in records:
+        template_config = config['files'].get(record['category'], {}).get(record['template'])
+        if template_config is None:
+            report.add(record['serial'], [f"template '{record['template']}' is no longer in the configuration"])
+            continue
+        cells = _record_cells(template_config['spec'], record)
+        documents.append((record['serial'], record['path'], record['template'], cells))
+
+    checked = _verify_batch(documents, workers, progress, cancel_event, metrics)
+    report.checked += checked.checked
+    report.failures.update(checked.failures)
+    with metrics.stage('lookup'):
+        # Every template's documents count, since templates can share a base serial number's counter
+        report.gaps = serial_gaps(
+            document['serial'] for base in sorted({record['base_serial'] for record in records})
+            for document in index.find(base_serial=base)
+        )
+    return report
+
+def _record_cells(spec: TemplateSpec, record: Dict) -> list:
+    """The (CellRef, value) pairs of a manifest-style record."""
+    values = record['values']
+    cells = spec.cells_for(values) + [(spec.serial_cell, values[spec.serial_key])]
+    for table_name, rows in record.get('tables', {}).items():
+        cells += spec.table_cells(table_name, rows)
+    return cells
+
+def _render_records(
+    config: Dict,
+    records: list,
+    output_paths: list,
+    engine: str,
+    profile: str,
+    workers: int,
+    progress: Callable,
+    cancel_event: threading.Event,
+    allow_template_change: bool,
+    metrics: GenerationMetrics
+) -> list:
+    """Render manifest-style records to their output paths; returns the positions of the records written."""
+    task_args = []
+    checked = set()
+    for record, output_path in zip(records, output_paths):
+        spec = config['files'][record['category']][record['template']]['spec']
+        issued_with = (spec.path, record['template_sha256'])
+        if issued_with not in checked and not allow_template_change:
+            if hash_cache.get(spec.path) != record['template_sha256']:
+                raise ValueError(f"Template '{record['template']}' has changed since {record['serial']} was issued.")
+            checked.add(issued_with)
+        task_args.append((spec.path, _record_cells(spec, record), output_path, engine, profile))
+
+    finished, _ = _render_batch(
+        save_modified_template, task_args, output_paths, workers, progress, cancel_event, metrics=metrics
+    )
+    return finished
+
+def resume_job(
+    config: Dict,
+    config_path: str,
+    job: GenerationJob,
+    workers: int = 1,
+    progress: Callable = None,
+    metrics: GenerationMetrics = None
+) -> list[str]:
+    """
+    Finish a batch left behind by an interrupted run, using the options it was started with.
+
+    Raises ValueError if another run has taken the batch up in the meantime.
+    """
+    if not job.claim():
+        raise ValueError("The batch is already being finished by another run.")
+    request = job.request
+    return process_template_generation(
+        config,
+        config_path,
+        request['category'],
+        request['template'],
+        request['inputs'],
+        request['quantity'],
+        request['output_dir'],
+        engine=job.options.get('engine', 'openpyxl'),
+        workers=workers,
+        progress=progress,
+        output_mode=request['output_mode'],
+        bundle_compresslevel=job.options.get('bundle_compresslevel', 6),
+        metrics=metrics,
+        tables=request.get('tables'),
+        profile=job.options.get('profile', 'default'),
+        layout=request.get('layout', 'flat'),
+        job=job
+    )
@@ -0,0 +1,220 @@
+"""
+File name: template_spec.py
+Template Spec - Config entries compiled into parsed, validated cell references
+
+load_config turns every template entry into a TemplateSpec. Its cell
+references are parsed once into (sheet index, row, column) tuples and checked
+against the sheet limits and the workbook's sheet names, so a bad mapping is
+reported when the config loads instead of as a warning for every file written.
+
+An entry may also describe tables: a block of rows starting at an anchor cell,
+filled from a list of row dicts (e.g. a CSV of line items) instead of one
+mapping per cell:
+
+    "tables": {
+        "Items": {"anchor": "A12", "columns": ["Item", "Description", "Qty"], "max_rows": 40}
+    }
+
+columns either lists names for consecutive columns from the anchor, or maps
+names to column letters ({"Item": "A", "Qty": "F"}). max_rows is optional and
+stops a long table from running over whatever follows it in the template.
+"""
+
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from xlsx_writer import column_index, read_sheet_names, split_coordinate
+
+# Largest row and column of an XLSX worksheet
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+
+class CellRef(NamedTuple):
+    """A parsed cell reference; sheet is the sheet's position in the workbook, or None for the active sheet."""
+    sheet: Optional[int]
+    row: int
+    column: int
+
+def parse_reference(coordinate: str) -> Tuple[Optional[str], int, int]:
+    """Parse 'Sheet1!C3' or 'C3' into (sheet name or None, row, column), checking the sheet limits."""
+    sheet_name, letters, row = split_coordinate(coordinate)
+    column = column_index(letters)
+    if row > MAX_ROW or column > MAX_COLUMN:
+        raise ValueError(f"Cell reference outside the worksheet: {coordinate}")
+    return sheet_name, row, column
+
+def resolve_reference(coordinate: str, sheet_names: List[str]) -> CellRef:
+    """Parse a coordinate and look its sheet up in the workbook's sheet names."""
+    sheet_name, row, column = parse_reference(coordinate)
+    if sheet_name is None:
+        return CellRef(None, row, column)
+    if sheet_name not in sheet_names:
+        raise ValueError(f"Unknown sheet '{sheet_name}' in {coordinate}")
+    return CellRef(sheet_names.index(sheet_name), row, column)
+
+def parse_results(results: Dict[str, str], sheet_names: List[str]) -> List[Tuple[CellRef, str]]:
+    """Convert a coordinate -> value dict into (CellRef, value) pairs, skipping empty values."""
+    cells = []
+    for coordinate, value in results.items():
+        if not value:
+            continue
+        try:
+            cells.append((resolve_reference(coordinate, sheet_names), value))
+        except ValueError as e:
+            print(f"Warning: Could not write to cell {coordinate}: {e}")
+    return cells
+
+class TableSpec:
+    """A table's anchor and columns, parsed."""
+
+    __slots__ = ('name', 'sheet_name', 'row', 'columns', 'max_rows')
+
+    def __init__(self, name: str, details: Dict):
+        self.name = name
+        self.sheet_name, self.row, first_column = parse_reference(details['anchor'])
+        columns = details['columns']
+        if not columns:
+            raise ValueError(f"Table '{name}' has no columns.")
+        if isinstance(columns, dict):
+            items = [(field, _column_number(letters)) for field, letters in columns.items()]
+        else:
+            items = [(field, first_column + offset) for offset, field in enumerate(columns)]
+        # Column names are matched case-insensitively
+        self.columns: Dict[str, int] = {}
+        for field, column in items:
+            if column > MAX_COLUMN:
+                raise ValueError(f"Table '{name}': column '{field}' is outside the worksheet")
+            self.columns[field.strip().lower()] = column
+        self.max_rows: Optional[int] = details.get('max_rows')
+
+def _column_number(letters: str) -> int:
+    if not re.fullmatch(r'[A-Za-z]{1,3}', letters):
+        raise ValueError(f"Invalid column: {letters}")
+    return column_index(letters)
+
+class TemplateSpec:
+    """
+    A template entry from the config with its cell references pre-parsed.
+
+    The last answer cell holds the serial number. References naming a sheet
+    are resolved against the workbook when the spec is built, and again if the
+    template file changes; entries without sheet names never open the file.
+    """
+
+    __slots__ = ('name', 'path', 'mappings', 'serial_key', 'cells', 'serial_cell', 'tables',
+                 '_named', '_sheet_indices', '_stamp')
+
+    def __init__(self, name: str, path: str, mappings: Dict[str, str], tables: Dict[str, Dict] = None):
+        if not mappings:
+            raise ValueError(f"Template '{name}' has no mappings.")
+        self.name = name
+        self.path = path
+        self.mappings = mappings
+        self.serial_key = list(mappings.values())[-1]
+        self._named: Dict[str, Tuple[str, int, int]] = {}
+        self._sheet_indices: Dict[str, int] = {}
+        self._stamp = None
+
+        self.cells: Dict[str, CellRef] = {}
+        for coordinate in list(mappings) + list(mappings.values()):
+            try:
+                sheet_name, row, column = parse_reference(coordinate)
+            except ValueError as e:
+                raise ValueError(f"Template '{name}': {e}") from None
+            if sheet_name is not None:
+                self._named[coordinate] = (sheet_name, row, column)
+            elif coordinate in mappings.values():
+                self.cells[coordinate] = CellRef(None, row, column)
+        self.serial_cell = self.cells.get(self.serial_key)
+
+        self.tables: Dict[str, TableSpec] = {}
+        for table_name, details in (tables or {}).items():
+            try:
+                self.tables[table_name] = TableSpec(table_name, details)
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Template '{name}', table '{table_name}': {e}") from None
+
+        if self._needs_sheet_names() and os.path.exists(path):
+            self.resolve()
+
+    def _needs_sheet_names(self) -> bool:
+        return bool(self._named) or any(table.sheet_name for table in self.tables.values())
+
+    def resolve(self):
+        """Map sheet names to sheet positions, re-reading the workbook only if it changed."""
+        if not self._needs_sheet_names():
+            return
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Template file not found: {self.path}")
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return
+
+        sheet_names = read_sheet_names(self.path)
+        answers = set(self.mappings.values())
+        for coordinate, (sheet_name, row, column) in self._named.items():
+            if sheet_name not in sheet_names:
+                raise ValueError(f"Template '{self.name}': unknown sheet '{sheet_name}' in {coordinate}")
+            if coordinate in answers:
+                self.cells[coordinate] = CellRef(sheet_names.index(sheet_name), row, column)
+        for table in self.tables.values():
+            if table.sheet_name and table.sheet_name not in sheet_names:
+                raise ValueError(f"Template '{self.name}': unknown sheet '{table.sheet_name}' in table '{table.name}'")
+        self._sheet_indices = {sheet_name: index for index, sheet_name in enumerate(sheet_names)}
+        self.serial_cell = self.cells[self.serial_key]
+        self._stamp = stamp
+
+    def invalidate(self):
+        """Forget the resolved sheet positions so the next resolve re-reads the workbook."""
+        self._stamp = None
+
+    def cells_for(self, user_inputs: Dict[str, str]) -> List[Tuple[CellRef, str]]:
+        """
+        The non-empty answers as (CellRef, value) pairs, serial number excluded.
+
+        Inputs for cells that are not answer cells of the template are parsed
+        here, once per batch, so the writers never see a coordinate string.
+        """
+        self.resolve()
+        cells = []
+        extra = {}
+        for coordinate, value in user_inputs.items():
+            if coordinate == self.serial_key or not value:
+                continue
+            ref = self.cells.get(coordinate)
+            if ref is None:
+                extra[coordinate] = value
+            else:
+                cells.append((ref, value))
+        if extra:
+            named = any('!' in coordinate for coordinate in extra)
+            cells.extend(parse_results(extra, read_sheet_names(self.path) if named else []))
+        return cells
+
+    def table_cells(self, table_name: str, rows: List[Dict[str, str]]) -> List[Tuple[CellRef, str]]:
+        """
+        The (CellRef, value) pairs filling a table with rows, one dict per line.
+
+        Row keys are column names (any case); an unknown name raises ValueError.
+        """
+        if table_name not in self.tables:
+            raise ValueError(f"Template '{self.name}' has no table '{table_name}'")
+        table = self.tables[table_name]
+        if table.max_rows is not None and len(rows) > table.max_rows:
+            raise ValueError(f"Table '{table_name}' holds at most {table.max_rows} rows, got {len(rows)}")
+        if table.row + len(rows) - 1 > MAX_ROW:
+            raise ValueError(f"Table '{table_name}' runs past the last worksheet row")
+        self.resolve()
+        sheet = self._sheet_indices[table.sheet_name] if table.sheet_name else None
+
+        cells = []
+        for offset, row in enumerate(rows):
+            for field, value in row.items():
+                column = table.columns.get(str(field).strip().lower())
+                if column is None:
+                    raise ValueError(f"Table '{table_name}' has no column '{field}'")
+                if value is not None and value != '':
+                    cells.append((CellRef(sheet, table.row + offset, column), str(value)))
+        return cells
@@ -0,0 +1,209 @@
+"""
+File name: verifier.py
+Batch Verifier - Reads generated documents back and checks every filled cell
+
+A document is checked by reading its worksheet XML straight out of the zip,
+without loading the workbook: only the filled cells are looked up, in one
+pass over each sheet. check_file checks every document held by one file (a
+single XLSX, a 'zip' bundle or a 'workbook' bundle) so each file is opened
+once; verify_documents in template_editor.py runs it over a batch in a
+process pool and collects a VerificationReport.
+"""
+
+import io
+import re
+import zipfile
+from html import unescape
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from metrics import GenerationMetrics
+from template_spec import CellRef
+from xlsx_writer import archive_layout, column_letters
+
+_PHONETIC_RE = re.compile(r'<rPh\b.*?</rPh>', re.S)
+_TEXT_RE = re.compile(r'<t\b[^>]*?(?:/>|>(.*?)</t>)', re.S)
+_SHARED_ITEM_RE = re.compile(r'<si\b[^>]*?(?:/>|>(.*?)</si>)', re.S)
+_TYPE_RE = re.compile(r'\bt="(\w+)"')
+_VALUE_RE = re.compile(r'<v\b[^>]*>(.*?)</v>', re.S)
+_FORMULA_RE = re.compile(r'<f\b[^>]*>(.*?)</f>', re.S)
+
+# Parsed layouts, shared by the documents of a template within this process
+_layouts: Dict = {}
+
+# (label, member of a 'zip' bundle or None, sheet of a 'workbook' bundle or None, [(CellRef, intended value)])
+Document = Tuple[str, Optional[str], Optional[str], List[Tuple[CellRef, str]]]
+
+class VerificationReport:
+    """What reading a batch back found: how many documents were checked, which failed and why, and serial gaps."""
+
+    def __init__(self):
+        self.checked = 0
+        self.failures: Dict[str, List[str]] = {}
+        self.gaps: List[str] = []
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures and not self.gaps
+
+    def add(self, label: str, problems: List[str]):
+        self.checked += 1
+        if problems:
+            self.failures[label] = problems
+
+    def summary(self) -> Dict:
+        """The report as a JSON-ready dict."""
+        return {
+            'passed': self.passed,
+            'checked': self.checked,
+            'failed': len(self.failures),
+            'failures': self.failures,
+            'gaps': self.gaps,
+        }
+
+    @classmethod
+    def from_summary(cls, summary: Dict) -> 'VerificationReport':
+        """Rebuild a report from summary(), e.g. as returned by the generation service."""
+        report = cls()
+        report.checked = summary['checked']
+        report.failures = summary['failures']
+        report.gaps = summary['gaps']
+        return report
+
+    def format(self, limit: int = 20) -> str:
+        """A pass/fail summary followed by at most limit of the failures."""
+        if self.passed:
+            return f"PASS: {self.checked} document(s) checked"
+        lines = [f"FAIL: {len(self.failures)} of {self.checked} document(s) failed"
+                 + (f", {len(self.gaps)} serial number(s) with no document" if self.gaps else "")]
+        for label, problems in list(self.failures.items())[:limit]:
+            lines.append(f"  {label}: {'; '.join(problems)}")
+        if len(self.failures) > limit:
+            lines.append(f"  ... and {len(self.failures) - limit} more")
+        if self.gaps:
+            shown = ', '.join(self.gaps[:limit]) + (', ...' if len(self.gaps) > limit else '')
+            lines.append(f"  No document for: {shown}")
+        return '\n'.join(lines)
+
+class VerificationError(Exception):
+    """A batch was written but failed verification; its documents are kept and its serial numbers used."""
+
+    def __init__(self, report: VerificationReport, files: List[str]):
+        super().__init__(f"Verification failed.\n{report.format()}")
+        self.report = report
+        self.files = files
+
+def serial_gaps(serial_numbers: Iterable[str]) -> List[str]:
+    """Serial numbers missing between the lowest and highest count of each base serial number."""
+    counts: Dict[str, set] = {}
+    for serial_number in serial_numbers:
+        base, _, count = serial_number.rpartition('-')
+        if base and count.isdigit():
+            counts.setdefault(base, set()).add(int(count))
+    gaps = []
+    for base, numbers in counts.items():
+        gaps += [f"{base}-{count}" for count in range(min(numbers), max(numbers) + 1) if count not in numbers]
+    return gaps
+
+def _text(xml: str) -> str:
+    """The text of an inline or shared string: its runs joined, phonetic guides left out."""
+    xml = _PHONETIC_RE.sub('', xml)
+    return ''.join(unescape(match.group(1) or '') for match in _TEXT_RE.finditer(xml))
+
+def _cell_value(cell_xml: str, shared_strings: Callable[[], List[str]]) -> str:
+    """A cell's value as text; a formula is given as '=formula', as it was written."""
+    formula = _FORMULA_RE.search(cell_xml)
+    if formula:
+        return '=' + unescape(formula.group(1))
+    cell_type = _TYPE_RE.search(cell_xml[:cell_xml.index('>') + 1])
+    cell_type = cell_type.group(1) if cell_type else 'n'
+    if cell_type == 'inlineStr':
+        return _text(cell_xml)
+    value = _VALUE_RE.search(cell_xml)
+    if value is None:
+        return ''
+    if cell_type == 's':
+        return shared_strings()[int(value.group(1))]
+    return unescape(value.group(1))
+
+def read_cells(sheet_xml: str, refs: Iterable[CellRef], shared_strings: Callable[[], List[str]]) -> Dict[Tuple[int, int], str]:
+    """(row, column) -> value of the cells present in a worksheet; cells not in the XML are left out."""
+    wanted = {f"{column_letters(ref.column)}{ref.row}": (ref.row, ref.column) for ref in refs}
+    if not wanted:
+        return {}
+    pattern = re.compile(
+        r'<c\b[^>]*?\br="(' + '|'.join(wanted) + r')"[^>]*?(?:/>|>.*?</c>)', re.S
+    )
+    values = {}
+    for match in pattern.finditer(sheet_xml):
+        values[wanted[match.group(1)]] = _cell_value(match.group(0), shared_strings)
+        if len(values) == len(wanted):
+            break
+    return values
+
+def _check_document(archive: zipfile.ZipFile, member: Optional[str], sheet_title: Optional[str],
+                    cells: List[Tuple[CellRef, str]]) -> List[str]:
+    """Compare a document's cells with the values intended for them; returns the problems found."""
+    if member is not None:
+        with zipfile.ZipFile(io.BytesIO(archive.read(member))) as document:
+            return _check_document(document, None, sheet_title, cells)
+
+    layout = archive_layout(archive, _layouts)
+    if sheet_title is not None and sheet_title not in layout.sheet_paths:
+        return [f"no sheet '{sheet_title}'"]
+
+    # The last value given for a cell is the one written
+    intended: Dict[str, Dict[Tuple[int, int], Tuple[str, str]]] = {}
+    for ref, value in cells:
+        if sheet_title is not None:
+            sheet_name = sheet_title
+        elif ref.sheet is None:
+            sheet_name = layout.active_sheet
+        else:
+            sheet_name = layout.sheet_names[ref.sheet]
+        coordinate = f"{column_letters(ref.column)}{ref.row}"
+        if ref.sheet is not None and sheet_title is None:
+            coordinate = f"{sheet_name}!{coordinate}"
+        intended.setdefault(sheet_name, {})[(ref.row, ref.column)] = (coordinate, str(value))
+
+    strings = []
+    def shared_strings() -> List[str]:
+        # Only read for documents that actually use the shared string table (openpyxl output)
+        if not strings and layout.shared_strings_path:
+            xml = archive.read(layout.shared_strings_path).decode('utf-8')
+            strings.extend(_text(match.group(1) or '') for match in _SHARED_ITEM_RE.finditer(xml))
+        return strings
+
+    problems = []
+    for sheet_name, sheet_cells in intended.items():
+        sheet_xml = archive.read(layout.sheet_paths[sheet_name]).decode('utf-8')
+        found = read_cells(sheet_xml, [CellRef(None, row, column) for row, column in sheet_cells], shared_strings)
+        for position, (coordinate, value) in sheet_cells.items():
+            if position not in found:
+                problems.append(f"{coordinate} expected {value!r}, cell is missing")
+            elif found[position] != value:
+                problems.append(f"{coordinate} expected {value!r}, found {found[position]!r}")
+    return problems
+
+def check_file(path: str, documents: List[Document], metrics: GenerationMetrics = None) -> List[Tuple[str, List[str]]]:
+    """
+    Check every document held by one file; returns (label, problems) per document.
+
+    A document's cells are read from the sheets they name, or all from
+    sheet_title for a document that is one sheet of a 'workbook' bundle. A
+    document that cannot be read fails with the reason as its problem.
+    """
+    metrics = metrics or GenerationMetrics()
+    with metrics.stage('verify'):
+        try:
+            archive = zipfile.ZipFile(path)
+        except (OSError, zipfile.BadZipFile) as e:
+            return [(label, [f"could not open {path}: {e}"]) for label, _, _, _ in documents]
+        results = []
+        with archive:
+            for label, member, sheet_title, cells in documents:
+                try:
+                    problems = _check_document(archive, member, sheet_title, cells)
+                except Exception as e:
+                    problems = [f"could not read: {e}"]
+                results.append((label, problems))
+        return results
@@ -0,0 +1,497 @@
+"""
+File name: xlsx_writer.py
+XLSX Writer - Fills template cells by patching the worksheet XML directly
+
+Only the worksheets that receive values are rewritten; every other member of
+the template zip is written back unchanged, so features openpyxl does not
+understand (images, data validation extensions, etc.) survive.
+
+ZipTemplate keeps the whole template in memory for speed. stream_template
+instead reads the template from disk for every copy and patches worksheets a
+chunk at a time, so memory stays bounded however large the template is.
+
+How the output is compressed is set by a writer profile (WRITER_PROFILES).
+With reuse_compressed, members copied unchanged from the template keep the
+template's compressed bytes instead of being inflated and deflated again.
+"""
+
+import codecs
+import posixpath
+import re
+import shutil
+import struct
+import zipfile
+from html import escape
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from xml.etree import ElementTree
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+_REF_RE = re.compile(r'^\$?([A-Za-z]{1,3})\$?([1-9]\d*)$')
+_ROW_RE = re.compile(r'<row\b[^>]*?\br="(\d+)"[^>]*?(/?)>')
+_CELL_RE = re.compile(r'<c\b[^>]*?\br="([A-Z]+)\d+"[^>]*?(?:/>|>.*?</c>)', re.S)
+
+# Distinct layouts archive_layout keeps when given a cache
+LAYOUT_CACHE_SIZE = 64
+
+# Bytes read from the template at a time by stream_template
+STREAM_CHUNK = 256 * 1024
+
+# zipfile has no public way to add data that is already compressed or to set
+# a member's compression level, so copy_info and write_compressed use these
+# private attributes, present since Python 3.7. They are checked before use
+# so that a Python that changes them fails with a clear error instead of
+# writing a corrupt zip.
+_ZIPFILE_INTERNALS = ('fp', 'filelist', 'NameToInfo', 'start_dir', '_writing')
+_ZIPINFO_INTERNALS = ('_compresslevel',)
+
+def _check_internals(obj, names: Tuple[str, ...]) -> None:
+    missing = [name for name in names if not hasattr(obj, name)]
+    if missing:
+        raise RuntimeError(
+            f"zipfile.{type(obj).__name__} has no {', '.join(missing)} in this Python version; "
+            "xlsx_writer needs updating for it"
+        )
+
+class WriterProfile(NamedTuple):
+    """How the members of a written XLSX are compressed."""
+    compression: int
+    # zlib level 1-9 for ZIP_DEFLATED; None is zlib's default (6)
+    compresslevel: Optional[int]
+    # Copy unchanged template members still compressed, as they are in the template
+    reuse_compressed: bool
+
+WRITER_PROFILES: Dict[str, WriterProfile] = {
+    'default': WriterProfile(zipfile.ZIP_DEFLATED, None, False),
+    # Least CPU per file: nothing is compressed
+    'stored': WriterProfile(zipfile.ZIP_STORED, None, False),
+    # Close to the default size for a fraction of the compression time
+    'fast': WriterProfile(zipfile.ZIP_DEFLATED, 1, True),
+    # Smallest files, for documents that are kept
+    'archive': WriterProfile(zipfile.ZIP_DEFLATED, 9, False),
+}
+
+# Local file header: signature and fixed-size part
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+_LOCAL_HEADER_SIZE = 30
+
+# Elements that may follow <calcPr> in workbook.xml
+_AFTER_CALC_PR = ('<oleSize', '<customWorkbookViews', '<pivotCaches', '<smartTagPr',
+                  '<smartTagTypes', '<webPublishing', '<fileRecoveryPr',
+                  '<webPublishObjects', '<extLst', '</workbook>')
+
+def column_index(letters: str) -> int:
+    """Convert column letters (A, B, ..., AA) to a 1-based index."""
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index
+
+def column_letters(index: int) -> str:
+    """Convert a 1-based column index to its letters."""
+    letters = ''
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def split_coordinate(coordinate: str) -> Tuple[str, str, int]:
+    """Split 'Sheet1!C3' or 'C3' into (sheet name or None, column letters, row)."""
+    sheet_name, cell = (coordinate.split('!') if '!' in coordinate else (None, coordinate))
+    if sheet_name:
+        sheet_name = sheet_name.strip("'")
+    match = _REF_RE.match(cell.strip())
+    if not match:
+        raise ValueError(f"Invalid cell reference: {coordinate}")
+    return sheet_name, match.group(1).upper(), int(match.group(2))
+
+class TemplateLayout:
+    """Where an XLSX template keeps its workbook and worksheets, read without loading the worksheets."""
+
+    def __init__(self, path: str, contents: Dict[str, bytes] = None):
+        self.path = path
+        if contents is None:
+            with zipfile.ZipFile(path) as archive:
+                contents = _layout_contents(archive)
+        self.workbook_path = _workbook_path(contents)
+        self.sheet_paths, self.active_sheet = _read_sheets(contents, self.workbook_path)
+        # Sheet members by position, to match the sheet index of a CellRef
+        self.sheet_names = list(self.sheet_paths)
+        self.sheet_members = list(self.sheet_paths.values())
+        self.recalc_workbook_xml = _with_full_calc(contents[self.workbook_path].decode('utf-8')).encode('utf-8')
+        self.shared_strings_path = _shared_strings_path(contents, self.workbook_path)
+
+class ZipTemplate(TemplateLayout):
+    """An XLSX template held in memory as its raw zip members, both inflated and as compressed in the file."""
+
+    def __init__(self, path: str):
+        with zipfile.ZipFile(path) as archive:
+            self.members: List[Tuple[zipfile.ZipInfo, bytes]] = [
+                (info, archive.read(info)) for info in archive.infolist()
+            ]
+        contents = {info.filename: data for info, data in self.members}
+        super().__init__(path, contents)
+        self._contents = contents
+        with open(path, 'rb') as f:
+            self.compressed: Dict[str, bytes] = {
+                info.filename: _read_compressed(f, info) for info, _ in self.members if can_reuse(info)
+            }
+
+    def sheet_xml(self, sheet_path: str) -> str:
+        """Return the XML text of a worksheet member."""
+        return self._contents[sheet_path].decode('utf-8')
+
+def read_sheet_names(path: str) -> List[str]:
+    """Sheet names of an XLSX file in workbook order, without reading the worksheets."""
+    with zipfile.ZipFile(path) as archive:
+        workbook_path = _workbook_path({'_rels/.rels': archive.read('_rels/.rels')})
+        workbook = ElementTree.fromstring(archive.read(workbook_path))
+    return [sheet.get('name') for sheet in workbook.iter(f'{MAIN_NS}sheet')]
+
+def _workbook_path(contents: Dict[str, bytes]) -> str:
+    """Find the workbook part through the package relationships."""
+    rels = ElementTree.fromstring(contents['_rels/.rels'])
+    for rel in rels.iter(f'{PKG_REL_NS}Relationship'):
+        if rel.get('Type', '').endswith('/officeDocument'):
+            return rel.get('Target').lstrip('/')
+    return 'xl/workbook.xml'
+
+def _workbook_rels_path(workbook_path: str) -> str:
+    return posixpath.join(posixpath.dirname(workbook_path), '_rels', posixpath.basename(workbook_path) + '.rels')
+
+def archive_layout(archive: zipfile.ZipFile, cache: Dict = None) -> TemplateLayout:
+    """
+    The layout of an XLSX archive that is already open, e.g. one inside a zip bundle.
+
+    With cache, archives whose workbook parts are byte-for-byte the same (the
+    documents of one template) share a single parsed layout.
+    """
+    contents = _layout_contents(archive)
+    if cache is None:
+        return TemplateLayout(archive.filename, contents)
+    key = tuple(contents.values())
+    if key not in cache:
+        if len(cache) >= LAYOUT_CACHE_SIZE:
+            cache.clear()
+        cache[key] = TemplateLayout(archive.filename, contents)
+    return cache[key]
+
+def _layout_contents(archive: zipfile.ZipFile) -> Dict[str, bytes]:
+    """Read just the members TemplateLayout needs."""
+    contents = {'_rels/.rels': archive.read('_rels/.rels')}
+    workbook_path = _workbook_path(contents)
+    for name in (workbook_path, _workbook_rels_path(workbook_path)):
+        contents[name] = archive.read(name)
+    return contents
+
+def _read_sheets(contents: Dict[str, bytes], workbook_path: str) -> Tuple[Dict[str, str], str]:
+    """Map sheet names to their worksheet members and find the active sheet."""
+    base = posixpath.dirname(workbook_path)
+    rels_path = _workbook_rels_path(workbook_path)
+    targets = {}
+    for rel in ElementTree.fromstring(contents[rels_path]).iter(f'{PKG_REL_NS}Relationship'):
+        target = rel.get('Target')
+        if target.startswith('/'):
+            targets[rel.get('Id')] = target.lstrip('/')
+        else:
+            targets[rel.get('Id')] = posixpath.normpath(posixpath.join(base, target))
+
+    workbook = ElementTree.fromstring(contents[workbook_path])
+    sheet_paths = {}
+    for sheet in workbook.iter(f'{MAIN_NS}sheet'):
+        sheet_paths[sheet.get('name')] = targets[sheet.get(f'{REL_NS}id')]
+
+    view = workbook.find(f'{MAIN_NS}bookViews/{MAIN_NS}workbookView')
+    active_tab = int(view.get('activeTab', 0)) if view is not None else 0
+    names = list(sheet_paths)
+    return sheet_paths, names[min(active_tab, len(names) - 1)]
+
+def _shared_strings_path(contents: Dict[str, bytes], workbook_path: str) -> Optional[str]:
+    """The shared string table's member, or None if the workbook has none."""
+    base = posixpath.dirname(workbook_path)
+    for rel in ElementTree.fromstring(contents[_workbook_rels_path(workbook_path)]).iter(f'{PKG_REL_NS}Relationship'):
+        if rel.get('Type', '').endswith('/sharedStrings'):
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(base, target))
+    return None
+
+def _with_full_calc(workbook_xml: str) -> str:
+    """Ask Excel to recalculate on open, since cached formula results may be stale."""
+    match = re.search(r'<calcPr\b[^>]*?/?>', workbook_xml)
+    if match:
+        if 'fullCalcOnLoad' in match.group(0):
+            return workbook_xml
+        tag = match.group(0)
+        end = -2 if tag.endswith('/>') else -1
+        patched = tag[:end] + ' fullCalcOnLoad="1"' + tag[end:]
+        return workbook_xml[:match.start()] + patched + workbook_xml[match.end():]
+    for marker in _AFTER_CALC_PR:
+        position = workbook_xml.find(marker)
+        if position != -1:
+            return workbook_xml[:position] + '<calcPr fullCalcOnLoad="1"/>' + workbook_xml[position:]
+    return workbook_xml
+
+def cell_xml(ref: str, value: str, style: str = None) -> str:
+    """Build an inline-string cell element."""
+    style_attr = f' s="{style}"' if style else ''
+    return (f'<c r="{ref}"{style_attr} t="inlineStr">'
+            f'<is><t xml:space="preserve">{escape(str(value), quote=False)}</t></is></c>')
+
+def _patch_row(row_xml: str, opening_tag: str, cells: Dict[int, Tuple[str, str]]) -> str:
+    """Replace or insert cells in one <row> element; cells maps column index -> (ref, value)."""
+    if opening_tag.endswith('/>'):
+        body = ''
+        opening_tag = opening_tag[:-2] + '>'
+    else:
+        body = row_xml[len(opening_tag):-len('</row>')]
+
+    pieces = []
+    position = 0
+    pending = dict(cells)
+    for cell in _CELL_RE.finditer(body):
+        index = column_index(cell.group(1))
+        # New cells that sort before this one
+        for new_index in sorted(i for i in pending if i < index):
+            pieces.append(body[position:cell.start()])
+            position = cell.start()
+            pieces.append(cell_xml(*pending.pop(new_index)))
+        if index in pending:
+            style = re.search(r'\bs="(\d+)"', cell.group(0).split('>', 1)[0])
+            ref, value = pending.pop(index)
+            pieces.append(body[position:cell.start()])
+            pieces.append(cell_xml(ref, value, style.group(1) if style else None))
+            position = cell.end()
+    pieces.append(body[position:])
+    for new_index in sorted(pending):
+        pieces.append(cell_xml(*pending[new_index]))
+
+    if pending:
+        # Spans are only a loading hint, drop them rather than recompute
+        opening_tag = re.sub(r'\sspans="[^"]*"', '', opening_tag)
+    return opening_tag + ''.join(pieces) + '</row>'
+
+def _new_row(row: int, cells: Dict[int, Tuple[str, str]]) -> str:
+    return f'<row r="{row}">' + ''.join(cell_xml(*cells[i]) for i in sorted(cells)) + '</row>'
+
+def patch_sheet_xml(xml: str, cells: List[Tuple[int, int, str]]) -> str:
+    """
+    Write (row, column index, value) cells into a worksheet's XML in a single pass.
+
+    Existing cells keep their style; missing cells and rows are inserted in
+    order. Only the rows being changed are parsed.
+    """
+    by_row: Dict[int, Dict[int, Tuple[str, str]]] = {}
+    for row, column, value in cells:
+        by_row.setdefault(row, {})[column] = (f'{column_letters(column)}{row}', value)
+    pending = sorted(by_row)
+    next_row = 0
+
+    pieces = []
+    position = 0
+    for match in _ROW_RE.finditer(xml):
+        if next_row == len(pending):
+            break
+        row_number = int(match.group(1))
+        # Rows that do not exist yet go in front of the first later row
+        while next_row < len(pending) and pending[next_row] < row_number:
+            pieces.append(xml[position:match.start()])
+            position = match.start()
+            pieces.append(_new_row(pending[next_row], by_row[pending[next_row]]))
+            next_row += 1
+        if next_row < len(pending) and pending[next_row] == row_number:
+            if match.group(2):
+                row_end = match.end()
+            else:
+                row_end = xml.index('</row>', match.end()) + len('</row>')
+            pieces.append(xml[position:match.start()])
+            pieces.append(_patch_row(xml[match.start():row_end], match.group(0), by_row[row_number]))
+            position = row_end
+            next_row += 1
+
+    tail = xml[position:]
+    if next_row < len(pending):
+        new_rows = ''.join(_new_row(row, by_row[row]) for row in pending[next_row:])
+        if '<sheetData/>' in tail:
+            tail = tail.replace('<sheetData/>', f'<sheetData>{new_rows}</sheetData>', 1)
+        else:
+            tail = tail.replace('</sheetData>', f'{new_rows}</sheetData>', 1)
+    pieces.append(tail)
+    return ''.join(pieces)
+
+def group_results(template: TemplateLayout, cells: List[Tuple]) -> Dict[str, List[Tuple[int, int, str]]]:
+    """Group (CellRef, value) pairs by the worksheet member they belong to."""
+    patches: Dict[str, List[Tuple[int, int, str]]] = {}
+    for (sheet, row, column), value in cells:
+        try:
+            sheet_path = template.sheet_paths[template.active_sheet] if sheet is None else template.sheet_members[sheet]
+        except IndexError:
+            print(f"Warning: Could not write to cell {column_letters(column)}{row}: no sheet {sheet}")
+            continue
+        patches.setdefault(sheet_path, []).append((row, column, value))
+    return patches
+
+def copy_info(info: zipfile.ZipInfo, profile: WriterProfile = None) -> zipfile.ZipInfo:
+    """Clone a member's header so the cached original is never mutated, compressed as the profile says."""
+    clone = zipfile.ZipInfo(info.filename, info.date_time)
+    clone.compress_type = info.compress_type
+    clone.external_attr = info.external_attr
+    clone.create_system = info.create_system
+    if profile is not None:
+        clone.compress_type = profile.compression
+        # No public setter; read by writestr and open(clone, 'w') when compressing
+        _check_internals(clone, _ZIPINFO_INTERNALS)
+        clone._compresslevel = profile.compresslevel
+    return clone
+
+def can_reuse(info: zipfile.ZipInfo) -> bool:
+    """Whether a member's compressed bytes can be copied into another zip as they are."""
+    return info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) and not info.flag_bits & 0x1
+
+def _data_offset(f, info: zipfile.ZipInfo) -> int:
+    """Position of a member's compressed data, just past its local header."""
+    f.seek(info.header_offset)
+    header = f.read(_LOCAL_HEADER_SIZE)
+    if header[:4] != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+    name_length, extra_length = struct.unpack('<2H', header[26:30])
+    return info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length
+
+def _read_compressed(f, info: zipfile.ZipInfo) -> bytes:
+    """A member's data as stored in the zip file f, without inflating it."""
+    f.seek(_data_offset(f, info))
+    return f.read(info.compress_size)
+
+def _iter_compressed(f, info: zipfile.ZipInfo) -> Iterator[bytes]:
+    """Like _read_compressed, a chunk at a time."""
+    f.seek(_data_offset(f, info))
+    remaining = info.compress_size
+    while remaining:
+        chunk = f.read(min(remaining, STREAM_CHUNK))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated data for {info.filename}")
+        remaining -= len(chunk)
+        yield chunk
+
+def write_compressed(archive: zipfile.ZipFile, info: zipfile.ZipInfo, chunks: Iterable[bytes]) -> None:
+    """
+    Add a member whose data is already compressed, e.g. copied from another zip.
+
+    zipfile can only compress data itself, so the local header is written
+    here and the member is registered for the central directory the same way
+    ZipFile.writestr does. The output must be seekable.
+    """
+    _check_internals(archive, _ZIPFILE_INTERNALS)
+    if archive.mode != 'w' or archive._writing:
+        # Only a new archive with no member open for writing is left consistent by the steps below
+        raise ValueError("write_compressed needs an archive opened with mode 'w' and no open member")
+    clone = copy_info(info)
+    clone.CRC = info.CRC
+    clone.compress_size = info.compress_size
+    clone.file_size = info.file_size
+    zip64 = clone.file_size > zipfile.ZIP64_LIMIT or clone.compress_size > zipfile.ZIP64_LIMIT
+    clone.header_offset = archive.fp.tell()
+    archive.fp.write(clone.FileHeader(zip64))
+    for chunk in chunks:
+        archive.fp.write(chunk)
+    archive.filelist.append(clone)
+    archive.NameToInfo[clone.filename] = clone
+    archive.start_dir = archive.fp.tell()
+
+def patch_template(template: ZipTemplate, cells: List[Tuple]) -> Dict[str, bytes]:
+    """Return the new content of every zip member that changes when the (CellRef, value) cells are filled in."""
+    patched = {}
+    for sheet_path, sheet_cells in group_results(template, cells).items():
+        patched[sheet_path] = patch_sheet_xml(template.sheet_xml(sheet_path), sheet_cells).encode('utf-8')
+    if patched:
+        patched[template.workbook_path] = template.recalc_workbook_xml
+    return patched
+
+def write_zip(template: ZipTemplate, patched: Dict[str, bytes], output,
+              profile: WriterProfile = WRITER_PROFILES['default']) -> None:
+    """Write the template's members, with patched ones replaced, to a path or file object."""
+    with zipfile.ZipFile(output, 'w', profile.compression, compresslevel=profile.compresslevel) as archive:
+        for info, data in template.members:
+            if info.filename in patched:
+                data = patched[info.filename]
+            elif profile.reuse_compressed and info.filename in template.compressed:
+                write_compressed(archive, info, [template.compressed[info.filename]])
+                continue
+            archive.writestr(copy_info(info, profile), data)
+
+def _last_row_number(xml: str) -> int:
+    """Number of the last <row> element in a piece of worksheet XML, or 0."""
+    position = xml.rfind('<row')
+    while position != -1:
+        match = _ROW_RE.match(xml, position)
+        if match:
+            return int(match.group(1))
+        position = xml.rfind('<row', 0, position)
+    return 0
+
+def stream_patch_sheet(reader, cells: List[Tuple[int, int, str]], chunk_size: int = STREAM_CHUNK) -> Iterator[bytes]:
+    """
+    Patch worksheet XML read from a binary stream, yielding the result in pieces.
+
+    The XML is cut into segments ending at a </row> and each segment only gets
+    the cells of rows up to its last row, so patch_sheet_xml never sees more
+    than about chunk_size characters (or one row, if a row is larger). Once
+    every cell is written the rest is passed through without decoding.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = sorted(cells)
+    buffer = ''
+    while pending:
+        chunk = reader.read(chunk_size)
+        buffer += decoder.decode(chunk, final=not chunk)
+        if chunk:
+            cut = buffer.rfind('</row>')
+            if cut == -1:
+                # Not even one whole row yet
+                continue
+            cut += len('</row>')
+            segment, buffer = buffer[:cut], buffer[cut:]
+            last_row = _last_row_number(segment)
+            due = 0
+            while due < len(pending) and pending[due][0] <= last_row:
+                due += 1
+        else:
+            # End of the sheet: rows past the last existing one go before </sheetData>
+            segment, buffer = buffer, ''
+            due = len(pending)
+        if due:
+            segment = patch_sheet_xml(segment, pending[:due])
+            pending = pending[due:]
+        yield segment.encode('utf-8')
+
+    yield buffer.encode('utf-8') + decoder.getstate()[0]
+    yield from iter(lambda: reader.read(chunk_size), b'')
+
+def stream_template(layout: TemplateLayout, cells: List[Tuple], output,
+                    profile: WriterProfile = WRITER_PROFILES['default']) -> None:
+    """
+    Write a filled-in copy of the template to a path or file object with bounded memory.
+
+    Members are copied through a small buffer and the worksheets receiving
+    cells are patched on the fly by stream_patch_sheet.
+    """
+    patches = group_results(layout, cells)
+    with zipfile.ZipFile(layout.path) as source, open(layout.path, 'rb') as raw_source, \
+            zipfile.ZipFile(output, 'w', profile.compression, compresslevel=profile.compresslevel) as target:
+        for info in source.infolist():
+            clone = copy_info(info, profile)
+            if patches and info.filename == layout.workbook_path:
+                target.writestr(clone, layout.recalc_workbook_xml)
+                continue
+            if profile.reuse_compressed and info.filename not in patches and can_reuse(info):
+                write_compressed(target, info, _iter_compressed(raw_source, info))
+                continue
+            # Zip64 headers only where a (patched) member could outgrow the 4 GB limit
+            large = info.file_size >= zipfile.ZIP64_LIMIT // 2
+            with source.open(info) as reader, target.open(clone, 'w', force_zip64=large) as writer:
+                if info.filename in patches:
+                    for piece in stream_patch_sheet(reader, patches[info.filename]):
+                        writer.write(piece)
+                else:
+                    shutil.copyfileobj(reader, writer, STREAM_CHUNK)
@@ -0,0 +1,109 @@
+"""
+File name: test_generation_jobs.py
+Generation job tests - Interrupted and cancelled batches keep their serial numbers straight
+"""
+
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Main'))
+
+from openpyxl import Workbook
+
+import template_editor
+from job_journal import jobs_dir
+from serial_ledger import get_ledger
+from template_editor import load_config, process_template_generation
+
+class _Crash(BaseException):
+    """Stands in for the process dying part way through a batch."""
+
+class GenerationJobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        template_path = os.path.join(self.directory.name, 'template.xlsx')
+        workbook = Workbook()
+        workbook.active['A1'] = 'Customer'
+        workbook.active['A2'] = 'Serial'
+        workbook.save(template_path)
+        self.config_path = os.path.join(self.directory.name, 'config.json')
+        with open(self.config_path, 'w') as f:
+            json.dump({'files': {'Cat': {'Tpl': {'path': template_path, 'mappings': {'A1': 'B1', 'A2': 'B2'}}}}}, f)
+        self.config = load_config(self.config_path)
+        self.output_dir = os.path.join(self.directory.name, 'out')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def generate(self, quantity: int = 5, **options) -> list:
+        return process_template_generation(self.config, self.config_path, 'Cat', 'Tpl', {'B1': 'ACME', 'B2': 'T'},
+                                           quantity, self.output_dir, engine='xml', **options)
+
+    def journals(self) -> list:
+        return glob.glob(os.path.join(jobs_dir(self.config_path), '*.jsonl'))
+
+    def names(self, files: list) -> list:
+        return sorted(os.path.basename(path) for path in files)
+
+    def test_rerun_after_crash_writes_only_the_missing_files(self):
+        def crash_after_two(done, total, label):
+            if done == 2:
+                raise _Crash()
+        with self.assertRaises(_Crash):
+            self.generate(progress=crash_after_two)
+        self.assertEqual(len(self.journals()), 1)
+
+        written = []
+        files = self.generate(progress=lambda done, total, label: written.append(os.path.basename(label)))
+        self.assertEqual(self.names(files), [f'Tpl_T-{count}.xlsx' for count in range(1, 6)])
+        self.assertEqual(sorted(written), ['Tpl_T-3.xlsx', 'Tpl_T-4.xlsx', 'Tpl_T-5.xlsx'])
+        self.assertEqual(get_ledger(self.config_path).get('T'), 5)
+        self.assertEqual(self.journals(), [])
+
+    def test_cancel_hands_back_the_unused_serial_numbers(self):
+        cancel_event = threading.Event()
+        def cancel_after_two(done, total, label):
+            if done == 2:
+                cancel_event.set()
+        files = self.generate(progress=cancel_after_two, cancel_event=cancel_event)
+        self.assertEqual(self.names(files), ['Tpl_T-1.xlsx', 'Tpl_T-2.xlsx'])
+        self.assertEqual(get_ledger(self.config_path).get('T'), 2)
+        self.assertEqual(self.journals(), [])
+
+        # The next batch carries on from the last serial number used
+        self.assertEqual(self.names(self.generate(quantity=1)), ['Tpl_T-3.xlsx'])
+
+    def test_cancel_with_a_gap_keeps_the_journal_until_resumed(self):
+        render_batch = template_editor._render_batch
+        def second_file_unfinished(task, task_args, labels, workers, progress, cancel_event, on_result, metrics):
+            # As in a process pool, where the third file can finish before the second
+            def skip_second(index, result):
+                if index != 1:
+                    on_result(index, result)
+            return render_batch(task, task_args, labels, workers, progress, cancel_event, skip_second, metrics)
+
+        cancel_event = threading.Event()
+        def cancel_after_three(done, total, label):
+            if done == 3:
+                cancel_event.set()
+        with mock.patch.object(template_editor, '_render_batch', second_file_unfinished):
+            files = self.generate(progress=cancel_after_three, cancel_event=cancel_event)
+        self.assertEqual(self.names(files), ['Tpl_T-1.xlsx', 'Tpl_T-3.xlsx'])
+        self.assertEqual(len(self.journals()), 1)
+        # Nothing is handed back, or T-2 could go to another batch
+        self.assertEqual(get_ledger(self.config_path).get('T'), 5)
+
+        files = self.generate()
+        self.assertEqual(self.names(files), [f'Tpl_T-{count}.xlsx' for count in range(1, 6)])
+        self.assertEqual(get_ledger(self.config_path).get('T'), 5)
+        self.assertEqual(self.journals(), [])
+
+if __name__ == '__main__':
+    unittest.main()
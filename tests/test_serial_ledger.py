@@ -0,0 +1,71 @@
+"""
+File name: test_serial_ledger.py
+Serial Ledger tests - No serial number is handed out twice across processes
+"""
+
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Main'))
+
+from serial_ledger import SerialLedger
+
+def _reserve_many(path: str, seed: int, rounds: int, queue):
+    """Worker: reserve random blocks on a ledger small enough to compact every few reservations."""
+    ledger = SerialLedger(path, max_entries=5)
+    rng = random.Random(seed)
+    blocks = []
+    for _ in range(rounds):
+        # No more serial numbers than the ledger keeps, so none is evicted
+        serial = str(rng.randrange(5))
+        first, last = ledger.reserve(serial, rng.randint(1, 5))
+        blocks.append((serial, first, last))
+    queue.put(blocks)
+
+class SerialLedgerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'serial_numbers.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assert_disjoint(self, blocks):
+        issued = {}
+        for serial, first, last in blocks:
+            for count in range(first, last + 1):
+                self.assertNotIn((serial, count), issued, f"{serial}-{count} issued twice")
+                issued[(serial, count)] = True
+
+    def test_compaction_by_another_ledger_is_noticed(self):
+        # Two ledgers on one file behave like two processes
+        first = SerialLedger(self.path, max_entries=5)
+        second = SerialLedger(self.path, max_entries=5)
+        blocks = [('filler', *first.reserve('filler', 1)) for _ in range(9)]
+        first.reserve('100', 1)
+        for _ in range(40):
+            # Enough appends for the second ledger to compact several times
+            blocks.append(('100', *second.reserve('100', 5)))
+        blocks.append(('100', *first.reserve('100', 5)))
+        self.assert_disjoint(blocks + [('100', 1, 1)])
+
+    def test_processes_never_share_a_serial_number(self):
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        workers = [context.Process(target=_reserve_many, args=(self.path, seed, 60, queue)) for seed in range(6)]
+        for worker in workers:
+            worker.start()
+        blocks = []
+        for _ in workers:
+            blocks += queue.get(timeout=120)
+        for worker in workers:
+            worker.join()
+        self.assert_disjoint(blocks)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+File name: test_xlsx_writer.py
+XLSX Writer tests - Worksheet XML is patched cell by cell, in memory or streamed
+"""
+
+import io
+import os
+import sys
+import unittest
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Main'))
+
+from xlsx_writer import MAIN_NS, patch_sheet_xml, stream_patch_sheet
+
+def _sheet(rows: str) -> str:
+    """A worksheet with the given <sheetData> content; an empty string gives <sheetData/>."""
+    sheet_data = f'<sheetData>{rows}</sheetData>' if rows else '<sheetData/>'
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<worksheet xmlns="{MAIN_NS[1:-1]}"><dimension ref="A1"/>{sheet_data}'
+            f'<pageMargins left="0.7" right="0.7" top="0.75" bottom="0.75" header="0.3" footer="0.3"/></worksheet>')
+
+def _cells(xml: str) -> dict:
+    """ref -> (text, style) of every cell, plus the row numbers in document order under None."""
+    root = ElementTree.fromstring(xml.encode('utf-8'))
+    cells = {None: [row.get('r') for row in root.iter(f'{MAIN_NS}row')]}
+    for row in root.iter(f'{MAIN_NS}row'):
+        refs = [cell.get('r') for cell in row.iter(f'{MAIN_NS}c')]
+        # Cells must stay in column order within a row
+        assert refs == sorted(refs, key=lambda ref: (len(ref), ref)), refs
+        for cell in row.iter(f'{MAIN_NS}c'):
+            text = ''.join(node.text or '' for node in cell.iter(f'{MAIN_NS}t'))
+            if not text and cell.find(f'{MAIN_NS}v') is not None:
+                text = cell.find(f'{MAIN_NS}v').text
+            cells[cell.get('r')] = (text, cell.get('s'))
+    return cells
+
+class PatchSheetXmlTest(unittest.TestCase):
+
+    def patch(self, rows: str, cells: list) -> dict:
+        """Patch in memory and streamed at several chunk sizes; both must agree. Returns the patched cells."""
+        xml = _sheet(rows)
+        patched = patch_sheet_xml(xml, cells)
+        for chunk_size in (1, 7, 64, 10 ** 6):
+            streamed = b''.join(stream_patch_sheet(io.BytesIO(xml.encode('utf-8')), cells, chunk_size))
+            self.assertEqual(streamed.decode('utf-8'), patched, f"chunk size {chunk_size}")
+        return _cells(patched)
+
+    def test_self_closing_row(self):
+        cells = self.patch('<row r="1"><c r="A1"><v>1</v></c></row><row r="2"/>', [(2, 2, 'x')])
+        self.assertEqual(cells['B2'], ('x', None))
+        self.assertEqual(cells['A1'], ('1', None))
+        self.assertEqual(cells[None], ['1', '2'])
+
+    def test_self_closing_cell_keeps_its_style(self):
+        cells = self.patch('<row r="1"><c r="A1" s="3"/><c r="B1" s="4"/></row>', [(1, 1, 'x')])
+        self.assertEqual(cells['A1'], ('x', '3'))
+        self.assertEqual(cells['B1'], ('', '4'))
+
+    def test_filled_cell_keeps_its_style(self):
+        cells = self.patch('<row r="1"><c r="B1" s="7" t="s"><v>0</v></c></row>', [(1, 2, 'new')])
+        self.assertEqual(cells['B1'], ('new', '7'))
+
+    def test_cells_inserted_before_between_and_after(self):
+        rows = '<row r="1" spans="2:4"><c r="B1"><v>2</v></c><c r="D1"><v>4</v></c></row>'
+        cells = self.patch(rows, [(1, 1, 'a'), (1, 3, 'c'), (1, 5, 'e')])
+        self.assertEqual({ref: value[0] for ref, value in cells.items() if ref},
+                         {'A1': 'a', 'B1': '2', 'C1': 'c', 'D1': '4', 'E1': 'e'})
+
+    def test_missing_rows_are_inserted_in_order(self):
+        rows = '<row r="2"><c r="A2"><v>2</v></c></row><row r="4"><c r="A4"><v>4</v></c></row>'
+        cells = self.patch(rows, [(1, 1, 'one'), (3, 2, 'three'), (6, 1, 'six')])
+        self.assertEqual(cells[None], ['1', '2', '3', '4', '6'])
+        self.assertEqual(cells['B3'], ('three', None))
+        self.assertEqual(cells['A6'], ('six', None))
+
+    def test_empty_sheet_data(self):
+        cells = self.patch('', [(2, 1, 'x'), (1, 2, 'y')])
+        self.assertEqual(cells[None], ['1', '2'])
+        self.assertEqual(cells['A2'], ('x', None))
+        self.assertEqual(cells['B1'], ('y', None))
+
+    def test_markup_in_values_is_escaped(self):
+        xml = patch_sheet_xml(_sheet(''), [(1, 1, 'R&D <draft> "A"')])
+        self.assertIn('R&amp;D &lt;draft&gt; "A"', xml)
+        self.assertEqual(_cells(xml)['A1'], ('R&D <draft> "A"', None))
+
+    def test_rows_not_patched_are_left_as_they_were(self):
+        rows = '<row r="1" spans="1:1" ht="30" customHeight="1"><c r="A1" s="2"><v>1</v></c></row><row r="2"/>'
+        xml = patch_sheet_xml(_sheet(rows), [(2, 1, 'x')])
+        self.assertIn('<row r="1" spans="1:1" ht="30" customHeight="1"><c r="A1" s="2"><v>1</v></c></row>', xml)
+
+if __name__ == '__main__':
+    unittest.main()